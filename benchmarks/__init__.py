@@ -0,0 +1,5 @@
+"""
+Benchmarks for the client, run against a local synthetic Open311 server.
+
+    $ python -m benchmarks.run --sizes 100 1000 --repeat 20
+"""
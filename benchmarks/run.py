@@ -0,0 +1,166 @@
+"""
+Measure throughput, latency and peak memory of the client, from the
+request through `Three.get` and `convert`, against a local synthetic
+Open311 server.
+
+    $ python -m benchmarks.run
+    $ python -m benchmarks.run --formats json --sizes 1000 10000 \\
+    ...     --latency 0.005 --error-rate 0.01 --output results.json
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+import simplejson as json
+
+from three import Three
+
+from .server import Open311Server
+
+
+def percentile(values, percent):
+    """The nearest-rank percentile of some values."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(0, int(round(percent / 100.0 * len(values))) - 1)
+    return values[min(rank, len(values) - 1)]
+
+
+def cases(size, page_size, workers):
+    """
+    The calls to time for a given size, each returning how many records
+    it brought back.
+    """
+    def requests(t):
+        return len(t._records(t.requests(page_size=size)))
+
+    def services(t):
+        return len(t._records(t.services()))
+
+    def post(t):
+        t.post('001', address='85 2nd St', description='Pothole',
+               name='Bench Mark', email='bench@example.com')
+        return 1
+
+    def pages(t):
+        return sum(len(page) for page in t.pages(page_size=page_size,
+                                                 workers=workers))
+
+    return [('requests', requests), ('services', services), ('post', post),
+            ('pages', pages)]
+
+
+def measure(call, client, repeat):
+    """
+    Time a call `repeat` times, after an untimed one to warm up the
+    connection pool, then run it once more for memory.
+    """
+    call(client)
+    latencies, records = [], 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        begun = time.perf_counter()
+        records += call(client)
+        latencies.append(time.perf_counter() - begun)
+    elapsed = time.perf_counter() - started
+    # Tracing slows everything down, so memory gets its own run.
+    tracemalloc.start()
+    try:
+        call(client)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'calls': repeat, 'records': records, 'seconds': elapsed,
+            'calls_per_second': repeat / elapsed,
+            'records_per_second': records / elapsed,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'peak_bytes': peak}
+
+
+def run(formats, sizes, repeat=10, page_size=100, page_cap=None,
+        latency=0, error_rate=0, workers=4):
+    """Run every case for each format and size, yielding a result dict."""
+    for size in sizes:
+        server = Open311Server(records=size, services=size,
+                               page_cap=page_cap, latency=latency,
+                               error_rate=error_rate)
+        with server:
+            for format in formats:
+                client = Three(server.endpoint, format=format,
+                               api_key='BENCHMARK', backoff=0.01,
+                               workers=workers)
+                for name, call in cases(size, page_size, workers):
+                    result = {'case': name, 'format': format, 'size': size}
+                    errors = server.errors
+                    try:
+                        result.update(measure(call, client, repeat))
+                    except Exception as error:
+                        result['error'] = '%s: %s' % (
+                            type(error).__name__, error)
+                    result['server_errors'] = server.errors - errors
+                    yield result
+
+
+def report(results, output):
+    """Print results as a table, as they come in."""
+    columns = ('case', 'format', 'size', 'calls/s', 'records/s', 'p50 ms',
+               'p90 ms', 'p99 ms', 'peak KiB', '503s')
+    row = '%-9s %-6s %7s %9s %11s %8s %8s %8s %9s %5s'
+    output.write(row % columns + '\n')
+    for result in results:
+        if 'error' in result:
+            output.write('%-9s %-6s %7d  failed: %s\n' % (
+                result['case'], result['format'], result['size'],
+                result['error']))
+        else:
+            output.write(row % (
+                result['case'], result['format'], result['size'],
+                '%.1f' % result['calls_per_second'],
+                '%.0f' % result['records_per_second'],
+                '%.2f' % (result['p50'] * 1000),
+                '%.2f' % (result['p90'] * 1000),
+                '%.2f' % (result['p99'] * 1000),
+                '%.0f' % (result['peak_bytes'] / 1024.0),
+                result['server_errors']) + '\n')
+        output.flush()
+        yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='benchmarks',
+        description="Benchmark the client against a synthetic server.")
+    parser.add_argument('--formats', nargs='+', choices=('json', 'xml'),
+                        default=['json', 'xml'])
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[100, 1000, 10000],
+                        help="records (and services) the server has")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="timed calls per case")
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--page-cap', type=int,
+                        help="most records the server returns per page")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="seconds the server waits before answering")
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help="fraction of calls answered with a 503")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="pages to fetch at once")
+    parser.add_argument('--output', help="also save the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = list(report(run(args.formats, args.sizes, args.repeat,
+                              args.page_size, args.page_cap, args.latency,
+                              args.error_rate, args.workers), sys.stdout))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+A stand-in Open311 server for benchmarks, with generated payloads.
+
+>>> from benchmarks.server import Open311Server
+>>> with Open311Server(records=5000, page_cap=1000, latency=0.01) as server:
+...     t = Three(server.endpoint)
+...     t.requests()
+"""
+
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+import simplejson as json
+
+
+STATUSES = ('open', 'closed')
+
+SERVICES = ('Pothole', 'Graffiti', 'Street Light', 'Abandoned Vehicle',
+            'Illegal Dumping', 'Sidewalk Repair', 'Tree Trimming')
+
+
+def generate_requests(count, seed=311):
+    """Generate `count` plausible service requests, the same every time."""
+    rng = random.Random(seed)
+    start = datetime(2012, 1, 1)
+    records = []
+    for index in range(count):
+        code = rng.randrange(len(SERVICES))
+        requested = start + timedelta(minutes=17 * index)
+        records.append({
+            'service_request_id': str(100000 + index),
+            'status': rng.choice(STATUSES),
+            'status_notes': 'Crew assigned' if index % 3 else '',
+            'service_name': SERVICES[code],
+            'service_code': '%03d' % code,
+            'description': 'Reported from the mobile app, request %d.' % index,
+            'agency_responsible': 'Public Works',
+            'requested_datetime': requested.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'updated_datetime': (requested + timedelta(days=2)).strftime(
+                '%Y-%m-%dT%H:%M:%SZ'),
+            'address': '%d Main St' % (index % 9000 + 1),
+            'zipcode': '31201',
+            'lat': round(32.8 + rng.random() / 10, 6),
+            'long': round(-83.7 + rng.random() / 10, 6),
+            'media_url': '',
+        })
+    return records
+
+
+def generate_services(count):
+    """Generate `count` service definitions."""
+    return [{'service_code': '%03d' % index,
+             'service_name': '%s %d' % (SERVICES[index % len(SERVICES)],
+                                        index),
+             'description': 'Requests about %s.' % (
+                 SERVICES[index % len(SERVICES)].lower()),
+             'metadata': 'false', 'type': 'realtime',
+             'keywords': 'street, repair', 'group': 'Streets'}
+            for index in range(count)]
+
+
+def to_xml(root, element, records):
+    """Serialize records the way Open311 XML responses look."""
+    parts = ['<?xml version="1.0" encoding="utf-8"?><%s>' % root]
+    for record in records:
+        parts.append('<%s>' % element)
+        for name, value in record.items():
+            parts.append('<%s>%s</%s>' % (name, escape(str(value)), name))
+        parts.append('</%s>' % element)
+    parts.append('</%s>' % root)
+    return ''.join(parts).encode('utf-8')
+
+
+class Open311Server(object):
+    """
+    A threaded HTTP server on localhost answering `requests`, `services`
+    and POSTs in JSON or XML. `records` and `services` set how much data
+    there is, `page_cap` silently caps how many requests one page returns
+    (like many real servers do), `latency` delays every response by that
+    many seconds, and `error_rate` is the fraction of calls answered with
+    a 503.
+    """
+
+    def __init__(self, records=1000, services=50, page_cap=None, latency=0,
+                 error_rate=0, seed=311):
+        self.records = generate_requests(records, seed)
+        self.services = generate_services(services)
+        self.page_cap = page_cap
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.bodies = {}
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:%d/' % self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, method, path, query):
+        """Find the status and body for a call."""
+        with self._lock:
+            self.calls += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return 503, b'Service Unavailable'
+        match = re.match(r'^/(requests|services)(?:/([^/.]+))?\.(json|xml)$',
+                         path)
+        if not match:
+            return 404, b'Not Found'
+        resource, id, format = match.groups()
+        if method == 'POST':
+            token = {'token': str(self.calls),
+                     'service_notice': 'Thanks for your report.'}
+            return 201, self._serialize(format, 'service_requests',
+                                        'request', [token])
+        if resource == 'services':
+            key = ('services', format)
+            records, root, element = self.services, 'services', 'service'
+        elif id:
+            key = ('request', id, format)
+            records = [r for r in self.records
+                       if r['service_request_id'] == id]
+            root, element = 'service_requests', 'request'
+        else:
+            size = int(query.get('page_size', [len(self.records)])[0])
+            if self.page_cap:
+                size = min(size, self.page_cap)
+            page = int(query.get('page', [1])[0])
+            key = ('requests', page, size, format)
+            records = self.records[(page - 1) * size:page * size]
+            root, element = 'service_requests', 'request'
+        if key not in self.bodies:
+            # Serializing is the server's cost, not the client's, so each
+            # body is only built once.
+            self.bodies[key] = self._serialize(format, root, element,
+                                               records)
+        return 200, self.bodies[key]
+
+    def _serialize(self, format, root, element, records):
+        if format == 'xml':
+            return to_xml(root, element, records)
+        return json.dumps(records).encode('utf-8')
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, so without this
+            # delayed ACKs would add 40ms to every call.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                self._answer('GET')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self.rfile.read(length)
+                self._answer('POST')
+
+            def _answer(self, method):
+                url = urlparse(self.path)
+                status, body = server.respond(method, url.path,
+                                              parse_qs(url.query))
+                self.send_response(status)
+                kind = 'xml' if url.path.endswith('.xml') else 'json'
+                self.send_header('Content-Type', 'application/%s' % kind)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
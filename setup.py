@@ -20,11 +20,20 @@ setup(
         'three'
     ],
     install_requires=[
+        'futures; python_version < "3"',
         'mock',
         'relaxml',
         'requests >= 1.0',
         'simplejson',
+        'urllib3 >= 1.26',
     ],
+    entry_points={
+        'console_scripts': ['three = three.cli:main'],
+    },
+    extras_require={
+        'async': ['aiohttp'],
+        'columns': ['numpy'],
+    },
     license='MIT',
     classifiers=[
         'Development Status :: 1 - Planning',
@@ -2,16 +2,39 @@
 Unit tests for the Three Open311 API wrapper.
 """
 
+import io
 import os
+import shutil
+import sys
+import tempfile
 import json
 import unittest
-from datetime import date
+import warnings
+from datetime import date, datetime
 from mock import Mock, MagicMock, patch
 
 import three
 import responses
-from three import core, Three, CityNotFound
+from three import (cli, core, Cache, Cassette, CassetteMiss, Metrics,
+                   RequestIndex, ServiceRequest, Store, Three,
+                   TokenResolver, CityNotFound)
 from three.core import requests as req
+from three.ratelimit import TokenBucket
+from three.stream import iter_json, iter_xml
+from three.submit import Ledger, MultipartStream
+
+try:
+    import numpy
+    from three.columns import Batch
+except ImportError:
+    numpy = None
+
+try:
+    import asyncio
+    from mock import AsyncMock
+    from three.aio import AsyncThree
+except (ImportError, SyntaxError):
+    AsyncThree = None
 
 
 class ThreeInit(unittest.TestCase):
@@ -51,10 +74,145 @@ class ThreeInit(unittest.TestCase):
         self.assertEqual(poolmanager.connection_pool_kw['ssl_version'],
                          ssl.PROTOCOL_TLSv1)
 
+    def test_cap_can_be_set(self):
+        t = Three('api.city.gov', cap=1000)
+        self.assertEqual(t.cap, 1000)
+
+    def test_workers_size_the_connection_pool(self):
+        t = Three('api.city.gov', workers=32)
+        self.assertEqual(t.workers, 32)
+        adapter = t.session.adapters['https://']
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+    def test_gets_are_retried_by_default(self):
+        t = Three('api.city.gov')
+        retries = t.session.adapters['https://'].max_retries
+        self.assertEqual(retries.total, 3)
+        self.assertTrue(retries.is_retry('GET', 503))
+        self.assertTrue(retries.is_retry('GET', 429))
+        self.assertFalse(retries.is_retry('POST', 503))
+
+    def test_posts_can_be_retried(self):
+        t = Three('api.city.gov', retries=5, retry_post=True)
+        retries = t.session.adapters['http://'].max_retries
+        self.assertEqual(retries.total, 5)
+        self.assertTrue(retries.is_retry('POST', 502))
+
+    def test_retries_can_be_turned_off(self):
+        t = Three('api.city.gov', retries=0)
+        self.assertEqual(t.retries.total, 0)
+
+    def test_backoff_can_be_turned_off(self):
+        t = Three('api.city.gov', backoff=0)
+        self.assertEqual(t.retries.backoff_factor, 0)
+        self.assertEqual(Three('api.city.gov').retries.backoff_factor, 0.5)
+
+    def test_unset_retries_use_the_default(self):
+        t = Three('api.city.gov', retries=None, backoff=None)
+        self.assertEqual(t.retries.total, 3)
+        self.assertEqual(t.retries.backoff_factor, 0.5)
+
+    def test_backoff_has_jitter(self):
+        retry = core.Retry(total=5, backoff_factor=1)
+        for attempt in range(3):
+            retry = retry.increment('GET', '/', error=Exception())
+        backoffs = set(retry.get_backoff_time() for _ in range(10))
+        self.assertTrue(len(backoffs) > 1)
+        self.assertTrue(all(0 <= backoff <= 4 for backoff in backoffs))
+
+    def test_pool_size_can_be_set(self):
+        t = Three('api.city.gov', pool_size=64)
+        self.assertEqual(t.session.adapters['http://']._pool_maxsize, 64)
+        self.assertEqual(t.session.adapters['https://']._pool_maxsize, 64)
+
     def tearDown(self):
         os.environ['OPEN311_API_KEY'] = ''
 
 
+class ThreeRateLimit(unittest.TestCase):
+
+    def test_bucket_allows_bursts(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        delays = [bucket.reserve() for _ in range(3)]
+        self.assertEqual(delays, [0, 0, 0])
+
+    def test_bucket_queues_instead_of_rejecting(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        self.assertEqual(bucket.reserve(), 0)
+        first, second = bucket.reserve(), bucket.reserve()
+        self.assertAlmostEqual(first, 0.1, places=2)
+        self.assertAlmostEqual(second, 0.2, places=2)
+
+    def test_limiters_are_shared_by_host(self):
+        first = Three('http://limited.example.com/macon/', rate_limit=5)
+        second = Three('http://limited.example.com/newark/', rate_limit=5)
+        self.assertTrue(first.limiter is second.limiter)
+        self.assertEqual(first.limiter.rate, 5)
+        self.assertEqual(Three('api.city.gov').limiter, None)
+
+    def test_conflicting_limits_warn(self):
+        Three('http://conflict.example.com/macon/', rate_limit=5)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            second = Three('http://conflict.example.com/newark/',
+                           rate_limit=1)
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(second.limiter.rate, 5)
+
+    def test_retries_wait_for_the_limiter(self):
+        t = Three('http://retried.example.com/', rate_limit=5)
+        self.assertTrue(t.retries.limiter is t.limiter)
+        retry = t.retries.increment('GET', '/', error=Exception())
+        self.assertTrue(retry.limiter is t.limiter)
+        retry.limiter = Mock()
+        retry.sleep()
+        self.assertEqual(retry.limiter.acquire.call_count, 1)
+
+    def test_requests_wait_for_the_limiter(self):
+        core.json = json
+        t = Three('api.city.gov', rate_limit=1)
+        t.limiter = Mock()
+        t.session = Mock()
+        t.session.get.return_value = Mock(content='[]')
+        t.requests()
+        t.requests()
+        self.assertEqual(t.limiter.acquire.call_count, 2)
+
+
+class ThreeThreads(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+
+    def test_last_response_is_tracked_per_thread(self):
+        import threading
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.side_effect = lambda url, params: Mock(
+            content=json.dumps([params['page']]))
+        seen = {}
+
+        def work(page):
+            t.requests(page=page)
+            seen[page] = json.loads(t._request.content)[0]
+
+        threads = [threading.Thread(target=work, args=(page,))
+                   for page in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(seen, dict((page, page) for page in range(8)))
+        self.assertEqual(t._request, None)
+
+    def test_post_response_is_tracked_per_thread(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.post.return_value = Mock(content='[]', status_code=201)
+        t.post('123')
+        self.assertTrue(t.post_response is t.session.post.return_value)
+
+
 @patch.object(req, 'Session', Mock())
 class ThreeDiscovery(unittest.TestCase):
 
@@ -103,6 +261,646 @@ class ThreeServices(unittest.TestCase):
         t.session.get.assert_called_with(expected, params=params)
 
 
+class ThreeCache(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.t = Three('api.city.gov', cache=Cache(size=2, ttl=60))
+        self.t.session = Mock()
+        self.t.session.get.return_value = Mock(
+            content='[{"service_code": "001"}]', status_code=200,
+            headers={'ETag': '"abc"'})
+
+    def test_fresh_entries_skip_the_network(self):
+        first = self.t.services()
+        second = self.t.services()
+        self.assertEqual(first, second)
+        self.assertEqual(self.t.session.get.call_count, 1)
+
+    def test_stale_entries_revalidate_with_etag(self):
+        first = self.t.services()
+        list(self.t.cache._entries.values())[0].expires = 0
+        self.t.session.get.return_value = Mock(status_code=304, headers={})
+        second = self.t.services()
+        self.assertTrue(second is first)
+        headers = self.t.session.get.call_args[1]['headers']
+        self.assertEqual(headers, {'If-None-Match': '"abc"'})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.t.services('1')
+        self.t.services('2')
+        self.t.services('1')
+        self.t.services('3')
+        urls = [key[0] for key in self.t.cache._entries]
+        self.assertEqual(urls, ['https://api.city.gov/services/1.json',
+                                'https://api.city.gov/services/3.json'])
+
+    def test_requests_and_tokens_bypass_the_cache(self):
+        self.t.requests()
+        self.t.requests()
+        self.t.token('a')
+        self.t.token('a')
+        self.assertEqual(self.t.session.get.call_count, 4)
+        self.assertFalse('headers' in self.t.session.get.call_args[1])
+
+    def test_other_resources_can_be_cached(self):
+        t = Three('api.city.gov', cache=Cache(ttls={'requests': 60}))
+        t.session = self.t.session
+        t.requests()
+        t.requests()
+        self.assertEqual(t.session.get.call_count, 1)
+
+    def test_per_resource_ttls(self):
+        cache = Cache(ttl=60, ttls={'services': 3600})
+        self.assertEqual(cache.ttl_for('services'), 3600)
+        self.assertEqual(cache.ttl_for('requests'), 60)
+
+
+class ThreeBackfill(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.t = Three('api.city.gov')
+        self.t.session = Mock()
+        # A server that caps results at two per query.
+        self.days = dict(('2012-01-%02dT00:00:00Z' % day, day)
+                         for day in range(1, 6))
+        self.t.session.get.side_effect = self.capped
+
+    def capped(self, url, params):
+        start, end = params['start_date'], params['end_date']
+        found = [{'service_request_id': day}
+                 for stamp, day in sorted(self.days.items())
+                 if start <= stamp <= end]
+        return Mock(content=json.dumps(found[:2]))
+
+    def test_backfill_splits_capped_windows(self):
+        records = self.t.backfill(['01-01-2012', '01-05-2012'], cap=2)
+        ids = [record['service_request_id'] for record in records]
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+
+    def test_backfill_takes_the_page_size_as_the_cap(self):
+        records = self.t.backfill([date(2012, 1, 1), date(2012, 1, 5)],
+                                  workers=2, count=2)
+        self.assertEqual(len(records), 5)
+
+    def test_backfill_reuses_the_first_response(self):
+        self.t.backfill(['01-01-2012', '01-05-2012'], count=2)
+        calls = self.t.session.get.call_args_list
+        self.assertNotEqual(calls[0][1]['params'], calls[1][1]['params'])
+
+    def test_backfill_short_of_the_page_size_is_not_split(self):
+        self.days = {'2012-01-02T00:00:00Z': 2}
+        records = self.t.backfill(['01-01-2012', '01-05-2012'], count=10)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(self.t.session.get.call_count, 1)
+
+    def test_backfill_without_a_cap_fetches_once(self):
+        records = self.t.backfill(['01-01-2012', '12-31-2012'])
+        self.assertEqual(len(records), 2)
+        self.assertEqual(self.t.session.get.call_count, 1)
+
+    def test_backfill_stops_when_halves_find_nothing_new(self):
+        # Five requests within a minute, on a server without a cap.
+        self.days = dict(('2012-06-01T00:00:%02dZ' % second, second)
+                         for second in range(5))
+        self.t.session.get.side_effect = lambda url, params: Mock(
+            content=json.dumps([
+                {'service_request_id': id}
+                for stamp, id in sorted(self.days.items())
+                if params['start_date'] <= stamp <= params['end_date']]))
+        records = self.t.backfill(['01-01-2012', '12-31-2012'], count=5)
+        self.assertEqual(len(records), 5)
+        self.assertEqual(self.t.session.get.call_count, 3)
+
+    def test_backfill_leaves_uncapped_windows_alone(self):
+        records = self.t.backfill(['01-01-2012', '01-05-2012'], cap=10)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(self.t.session.get.call_count, 1)
+
+
+class ThreeRequestsInBbox(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.t = Three('api.city.gov')
+        self.t.session = Mock()
+        # Requests on a grid, from a server capping results at three.
+        self.points = [(32.80 + row * 0.01, -83.70 + column * 0.01)
+                       for row in range(5) for column in range(5)]
+        self.t.session.get.side_effect = self.capped
+
+    def capped(self, url, params):
+        center = (params['lat'], params['long'])
+        found = [{'service_request_id': index, 'lat': str(lat),
+                  'long': str(long)}
+                 for index, (lat, long) in enumerate(self.points)
+                 if three.geo.distance(center, (lat, long)) <= params['radius']]
+        return Mock(content=json.dumps(found[:3]))
+
+    def test_full_tiles_are_split(self):
+        records = self.t.requests_in_bbox((32.795, -83.705, 32.825, -83.675),
+                                          cap=3, workers=2)
+        ids = sorted(record['service_request_id'] for record in records)
+        self.assertEqual(ids, [0, 1, 2, 5, 6, 7, 10, 11, 12])
+
+    def test_tiles_and_page_size_as_the_cap(self):
+        records = self.t.requests_in_bbox((32.795, -83.705, 32.845, -83.655),
+                                          tile=0.025, count=3)
+        self.assertEqual(len(records), 25)
+        params = self.t.session.get.call_args_list[0][1]['params']
+        self.assertEqual(params['lat'], 32.8075)
+        self.assertTrue(params['radius'] > 0)
+
+    def test_empty_first_tile_still_splits_full_ones(self):
+        records = self.t.requests_in_bbox((32.70, -83.705, 32.845, -83.655),
+                                          tile=0.0725, count=3)
+        self.assertEqual(len(records), 25)
+        params = [call[1]['params']
+                  for call in self.t.session.get.call_args_list]
+        self.assertEqual(len(params), len(set(
+            (p['lat'], p['long'], p['radius']) for p in params)))
+
+    def test_without_a_cap_tiles_are_fetched_once(self):
+        self.points = [(32.81, -83.69)] * 3
+        records = self.t.requests_in_bbox((32.795, -83.705, 32.845, -83.655),
+                                          tile=0.025)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(self.t.session.get.call_count, 4)
+
+    def test_pieces_finding_nothing_new_are_not_split(self):
+        # Three requests at one spot fill every tile around it.
+        self.points = [(32.81, -83.69)] * 3
+        records = self.t.requests_in_bbox((32.795, -83.705, 32.845, -83.655),
+                                          cap=3)
+        self.assertEqual(len(records), 3)
+        self.assertEqual(self.t.session.get.call_count, 5)
+
+
+class ThreeStream(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.xml = (b'<?xml version="1.0" encoding="utf-8"?>'
+                    b'<service_requests>'
+                    b'<request><service_request_id>1</service_request_id>'
+                    b'<status>open</status><media_url/></request>'
+                    b'<request><service_request_id>2</service_request_id>'
+                    b'<keywords>a</keywords><keywords>b</keywords></request>'
+                    b'</service_requests>')
+
+    def test_iter_xml_yields_records(self):
+        chunks = [self.xml[i:i + 7] for i in range(0, len(self.xml), 7)]
+        records = list(iter_xml(chunks))
+        self.assertEqual(records, [
+            {'service_request_id': '1', 'status': 'open', 'media_url': {}},
+            {'service_request_id': '2', 'keywords': ['a', 'b']}])
+
+    @patch('three.stream.XMLPullParser', None)
+    def test_iter_xml_without_a_pull_parser(self):
+        # Python 2 only has iterparse.
+        chunks = [self.xml[i:i + 7] for i in range(0, len(self.xml), 7)]
+        records = list(iter_xml(chunks))
+        self.assertEqual(records, [
+            {'service_request_id': '1', 'status': 'open', 'media_url': {}},
+            {'service_request_id': '2', 'keywords': ['a', 'b']}])
+
+    def test_stream_parses_xml_incrementally(self):
+        t = Three('api.city.gov', format='xml')
+        t.session = Mock()
+        t.session.get.return_value.iter_content.return_value = [self.xml]
+        records = list(t.stream('requests', status='open'))
+        self.assertEqual(len(records), 2)
+        expected = 'https://api.city.gov/requests.xml'
+        t.session.get.assert_called_with(expected, params={'status': 'open'},
+                                         stream=True)
+        self.assertTrue(t.session.get.return_value.close.called)
+
+
+class ThreeStreamJSON(unittest.TestCase):
+
+    def test_iter_json_yields_items_across_chunks(self):
+        content = json.dumps([{'id': 1, 'name': u'caf\xe9'}, {'id': 2},
+                              12, 'three']).encode('utf-8')
+        chunks = [content[i:i + 3] for i in range(0, len(content), 3)]
+        items = list(iter_json(chunks))
+        self.assertEqual(items, [{'id': 1, 'name': u'caf\xe9'}, {'id': 2},
+                                 12, 'three'])
+
+    def test_iter_json_handles_empty_arrays(self):
+        self.assertEqual(list(iter_json([b' [ ', b'] '])), [])
+
+    def test_iter_json_rejects_unterminated_arrays(self):
+        self.assertRaises(ValueError, list, iter_json([b'[{"id": 1},']))
+
+    def test_stream_decodes_json_incrementally(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.return_value.iter_content.return_value = [
+            b'[{"service_request_id": 1}', b', {"service_request_id": 2}]']
+        records = list(t.stream('requests'))
+        self.assertEqual(len(records), 2)
+
+
+class ThreeRecords(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.data = {'service_request_id': 638344, 'status': 'open',
+                     'service_code': '006', 'lat': '37.76',
+                     'long': -122.41, 'media_url': {},
+                     'requested_datetime': '2010-04-14T06:37:38-08:00',
+                     'updated_datetime': '2010-04-14T14:37:38Z',
+                     'token': 'abc123'}
+
+    def test_known_fields_are_parsed(self):
+        record = ServiceRequest.from_dict(self.data)
+        self.assertEqual(record.service_request_id, '638344')
+        self.assertEqual(record.lat, 37.76)
+        self.assertEqual(record.media_url, None)
+        self.assertEqual(record.requested_datetime,
+                         record.updated_datetime)
+        self.assertEqual(record.requested_datetime.hour, 6)
+
+    def test_unknown_fields_overflow(self):
+        record = ServiceRequest.from_dict(self.data)
+        self.assertEqual(record.extra, {'token': 'abc123'})
+        self.assertEqual(record['token'], 'abc123')
+        self.assertEqual(record.get('missing', 'default'), 'default')
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_records_setting_for_requests(self):
+        t = Three('api.city.gov', records=True)
+        t.session = Mock()
+        t.session.get.return_value = Mock(content=json.dumps([self.data]))
+        records = t.requests()
+        self.assertTrue(isinstance(records[0], ServiceRequest))
+        self.assertEqual(records[0].status, 'open')
+
+    def test_records_setting_for_xml_request(self):
+        t = Three('api.city.gov', format='xml', records=True)
+        t.convert = Mock(return_value={'request': self.data})
+        t.session = Mock()
+        records = t.request('638344')
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].service_code, '006')
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ThreeColumns(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.records = [
+            {'service_request_id': 1, 'status': 'open', 'lat': '37.5',
+             'long': -122.5, 'service_code': '001',
+             'requested_datetime': '2012-03-10T06:00:00-08:00'},
+            {'service_request_id': 2, 'status': 'closed', 'lat': {},
+             'service_code': '001'},
+            {'service_request_id': 3, 'status': 'open', 'service_code': 2}]
+
+    def test_numeric_and_datetime_columns(self):
+        batch = Batch(self.records)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch['lat'][0], 37.5)
+        self.assertTrue(numpy.isnan(batch['lat'][1]))
+        self.assertEqual(batch['requested_datetime'][0],
+                         numpy.datetime64('2012-03-10T14:00:00'))
+        self.assertTrue(numpy.isnat(batch['requested_datetime'][1]))
+
+    def test_categorical_columns(self):
+        batch = Batch(self.records)
+        self.assertEqual(batch.counts('status'), {'open': 2, 'closed': 1})
+        self.assertEqual(batch['service_code'].categories, ['001', '2'])
+        self.assertEqual(batch['status'].mask('open').tolist(),
+                         [True, False, True])
+        self.assertEqual(batch['status'].values(),
+                         ['open', 'closed', 'open'])
+
+    def test_batches_from_pages(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.side_effect = pages(self.records[:2],
+                                          self.records[2:])
+        sizes = [len(batch) for batch in t.batches(size=2)]
+        self.assertEqual(sizes, [2, 1])
+
+
+class ThreeRequestMany(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.t = Three('api.city.gov')
+        self.t.session = Mock()
+        self.t.session.get.side_effect = lambda url, params: Mock(
+            content=json.dumps([{'service_request_id': int(id)}
+                                for id in params['service_request_id']
+                                .split(',') if id != '404']))
+
+    def test_results_are_keyed_by_id(self):
+        results = self.t.request_many([1, '2', 404, 3])
+        self.assertEqual(sorted(results), ['1', '2', '3', '404'])
+        self.assertEqual(results['2'], {'service_request_id': 2})
+        self.assertEqual(results['404'], None)
+        self.assertEqual(self.t.session.get.call_count, 1)
+        url, = self.t.session.get.call_args[0]
+        self.assertEqual(url, 'https://api.city.gov/requests.json')
+
+    def test_ids_are_batched(self):
+        results = self.t.request_many(range(10), size=3, workers=2)
+        self.assertEqual(len(results), 10)
+        self.assertEqual(self.t.session.get.call_count, 4)
+
+    def test_batches_respect_url_length(self):
+        batches = self.t._id_batches(['12345'] * 4, size=100, length=16)
+        self.assertEqual(batches, [['12345', '12345']] * 2)
+
+
+class ThreeMetrics(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.metrics = Metrics()
+        self.events = []
+        self.t = Three('api.city.gov', city='macon',
+                       hooks=[self.metrics, self.events.append])
+        self.t.session = Mock()
+        self.t.session.get.return_value = Mock(status_code=200,
+                                               content='[{"id": 1}]')
+
+    def test_hooks_receive_timed_events(self):
+        self.t.requests()
+        event, = self.events
+        self.assertEqual(event['method'], 'GET')
+        self.assertEqual(event['url'], 'https://api.city.gov/requests.json')
+        self.assertEqual(event['city'], 'macon')
+        self.assertEqual(event['status'], 200)
+        self.assertEqual(event['bytes'], 11)
+        for phase in ('ttfb', 'download', 'parse'):
+            self.assertTrue(event[phase] >= 0)
+        self.assertTrue(self.t.session.get.call_args[1]['stream'])
+
+    def test_no_hooks_leaves_requests_alone(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.return_value = Mock(content='[]')
+        t.requests()
+        t.session.get.assert_called_with(
+            'https://api.city.gov/requests.json', params={})
+
+    def test_metrics_are_aggregated(self):
+        self.t.requests()
+        self.t.services()
+        data = self.metrics.as_dict()
+        row, = data['requests']
+        self.assertEqual(row, {'city': 'macon', 'method': 'GET',
+                               'status': '200', 'count': 2, 'bytes': 22})
+        self.assertEqual([row['phase'] for row in data['latency']],
+                         ['download', 'parse', 'ttfb'])
+        self.assertEqual(data['latency'][0]['buckets'][10.0], 2)
+
+    def test_prometheus_text(self):
+        self.t.requests()
+        text = self.metrics.prometheus()
+        self.assertTrue('three_requests_total{city="macon",method="GET",'
+                        'status="200"} 1\n' in text)
+        self.assertTrue('three_seconds_count{phase="ttfb",city="macon",'
+                        'method="GET"} 1\n' in text)
+
+
+class ThreeCassette(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'city.zip')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, content, **kwargs):
+        with Cassette(self.path, 'record') as cassette:
+            t = Three('api.city.gov', cassette=cassette)
+            t.session = Mock()
+            t.session.get.return_value = Mock(
+                status_code=200, content=content, encoding='utf-8',
+                headers={'Content-Type': 'application/json'})
+            t.requests(**kwargs)
+
+    def test_responses_are_replayed_without_the_network(self):
+        self.record('[{"service_request_id": 1}]', status='open')
+        t = Three('api.city.gov', cassette=self.path)
+        t.session = Mock()
+        self.assertEqual(t.requests(status='open'),
+                         [{'service_request_id': 1}])
+        self.assertFalse(t.session.get.called)
+        self.assertRaises(CassetteMiss, t.requests, status='closed')
+
+    def test_missing_paths_are_recorded(self):
+        t = Three('api.city.gov', cassette=self.path)
+        self.assertFalse(t.cassette.replaying)
+        cassette = t.cassette
+        t.configure(api_key='KEY')
+        t.reset()
+        self.assertTrue(t.cassette is cassette)
+        t.configure(cassette=None)
+        self.assertEqual(t.cassette, None)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_keys_ignore_parameter_order_and_api_keys(self):
+        cassette = Cassette(self.path, 'record')
+        first = cassette.key('get', 'https://a.gov/requests.json',
+                             {'params': {'b': 2, 'a': 1, 'api_key': 'X'}})
+        second = cassette.key('GET', 'https://a.gov/requests.json',
+                              {'params': {'a': '1', 'b': '2'}})
+        cassette.close()
+        self.assertEqual(first, second)
+
+    def test_recording_again_keeps_earlier_responses(self):
+        self.record('[{"service_request_id": 1}]', status='open')
+        self.record('[{"service_request_id": 2}]', status='closed')
+        self.record('[{"service_request_id": 3}]', status='open')
+        with Cassette(self.path) as cassette:
+            t = Three('api.city.gov', cassette=cassette)
+            self.assertEqual(t.requests(status='open'),
+                             [{'service_request_id': 3}])
+            self.assertEqual(t.requests(status='closed'),
+                             [{'service_request_id': 2}])
+
+
+class ThreeRequestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = RequestIndex([
+            {'service_request_id': 1, 'service_code': '001',
+             'status': 'open', 'lat': 32.84, 'long': -83.63,
+             'requested_datetime': '2013-01-05T10:00:00-05:00'},
+            {'service_request_id': 2, 'service_code': '002',
+             'status': 'closed', 'lat': 32.84, 'long': -83.62,
+             'requested_datetime': '2013-01-20T10:00:00Z'},
+            {'service_request_id': 3, 'service_code': '001',
+             'status': 'closed', 'lat': 33.5, 'long': -84.0,
+             'requested_datetime': '2013-02-01T10:00:00Z'},
+            {'service_request_id': 4, 'service_code': '001',
+             'status': 'open', 'lat': {}, 'long': {}},
+        ])
+
+    def ids(self, **filters):
+        return [r['service_request_id'] for r in self.index.query(**filters)]
+
+    def test_spatial_queries(self):
+        self.assertEqual(self.ids(bbox=(32.8, -83.7, 32.9, -83.6)), [1, 2])
+        self.assertEqual(self.ids(bbox=(-90, -180, 90, 180)), [1, 2, 3])
+        self.assertEqual(self.ids(near=(32.84, -83.63), radius=500), [1])
+        self.assertEqual(self.ids(near=(32.84, -83.63), radius=1000), [1, 2])
+
+    def test_composed_queries(self):
+        self.assertEqual(self.ids(service_code='001', status='open'), [1, 4])
+        self.assertEqual(self.ids(status=['open', 'closed'],
+                                  start=date(2013, 1, 5),
+                                  end='01-20-2013'), [1, 2])
+        self.assertEqual(self.ids(bbox=(32.8, -83.7, 32.9, -83.6),
+                                  service_code='001'), [1])
+        self.assertEqual(self.ids(service_code='001', description='x'), [])
+        self.assertEqual(self.ids(description='x'), [])
+
+    def test_unindexed_fields_are_checked(self):
+        index = RequestIndex([
+            {'service_request_id': 1, 'description': 'a', 'status': 'open'},
+            {'service_request_id': 2, 'description': 'b', 'status': 'open'}])
+        ids = lambda **filters: [r['service_request_id']
+                                 for r in index.query(**filters)]
+        self.assertEqual(ids(description='zzz'), [])
+        self.assertEqual(ids(description='a', status='open'), [1])
+        self.assertEqual(ids(description=['a', 'b']), [1, 2])
+        self.assertEqual(self.index.count(status='closed'), 2)
+
+    def test_records_are_replaced_by_id(self):
+        self.index.add([ServiceRequest.from_dict(
+            {'service_request_id': '1', 'status': 'closed',
+             'lat': '40.0', 'long': '-75.0',
+             'requested_datetime': '2014-01-01T00:00:00Z'})])
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.ids(status='open'), [4])
+        self.assertEqual(self.ids(start='2013-12-31'), ['1'])
+        self.assertEqual(self.ids(bbox=(32.8, -83.7, 32.9, -83.6)), [2])
+
+
+class ThreeTokenResolver(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'pending.json')
+        self.client = Three('api.city.gov')
+        self.client.session = Mock()
+        self.checks = {}
+        self.client.session.get.side_effect = self.token
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def token(self, url, params):
+        token = url.split('/')[-1].split('.')[0]
+        self.checks[token] = self.checks.get(token, 0) + 1
+        # Each token resolves after as many checks as its name says.
+        id = token if self.checks[token] >= int(token[-1]) else ''
+        return Mock(content=json.dumps([{'token': token,
+                                         'service_request_id': id}]))
+
+    def test_tokens_resolve_with_backoff(self):
+        resolver = TokenResolver(self.client, self.path, delay=0.01)
+        resolver.add(['a1', 'b3', 'c2'])
+        results = dict(resolver.resolve(timeout=5))
+        self.assertEqual(results, {'a1': 'a1', 'b3': 'b3', 'c2': 'c2'})
+        self.assertEqual(self.checks, {'a1': 1, 'b3': 3, 'c2': 2})
+        self.assertEqual(resolver.pending, set())
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), [])
+
+    def test_pending_tokens_survive_restarts(self):
+        resolver = TokenResolver(self.client, self.path, delay=10)
+        resolver.add(['a1', 'z9'])
+        self.assertEqual(list(resolver.resolve(timeout=0.2)),
+                         [('a1', 'a1')])
+        restarted = TokenResolver(self.client, self.path)
+        self.assertEqual(restarted.pending, set(['z9']))
+
+
+class ThreeStore(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.client = Three('api.city.gov')
+        self.client.session = Mock()
+        self.store = Store(':memory:', self.client)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_sync_upserts_by_service_request_id(self):
+        self.client.session.get.side_effect = pages(
+            [{'service_request_id': 1, 'status': 'open'},
+             {'service_request_id': 2, 'status': 'open'}], [],
+            [{'service_request_id': 1, 'status': 'closed'}], [])
+        self.store.sync(since=date(2013, 1, 1), until=date(2013, 2, 1))
+        self.store.sync(refresh=False)
+        self.assertEqual(self.store.count(), 2)
+        self.assertEqual(self.store.request(1)['status'], 'closed')
+        self.assertEqual(len(self.store.requests(status='open')), 1)
+
+    def test_sync_refreshes_open_requests(self):
+        self.client.session.get.side_effect = pages(
+            [{'service_request_id': 1, 'status': 'open'},
+             {'service_request_id': 2, 'status': 'open'}], [],
+            [], [{'service_request_id': 2, 'status': 'closed'}])
+        self.store.sync(since='01-01-2013', until='02-01-2013')
+        self.store.sync(until='03-01-2013')
+        self.assertEqual(self.store.request(2)['status'], 'closed')
+        self.assertEqual(self.store.count(status='open'), 1)
+        params = self.client.session.get.call_args[1]['params']
+        self.assertEqual(params['service_request_id'], '1,2')
+
+    def test_queries_parse_date_strings(self):
+        self.store.upsert([
+            {'service_request_id': 1,
+             'requested_datetime': '2013-01-05T10:00:00Z'},
+            {'service_request_id': 2,
+             'requested_datetime': '2013-12-30T10:00:00Z'}])
+        self.assertEqual(self.store.count(start='12-31-2013'), 0)
+        self.assertEqual(self.store.count(end='12-31-2013'), 2)
+        self.assertEqual(self.store.count(start='2013-06-01'), 1)
+
+    def test_end_dates_cover_the_whole_day(self):
+        self.store.upsert([
+            {'service_request_id': 1,
+             'requested_datetime': '2013-12-31T18:00:00Z'}])
+        self.assertEqual(self.store.count(end='12-31-2013'), 1)
+        self.assertEqual(self.store.count(end=date(2013, 12, 31)), 1)
+        self.assertEqual(self.store.count(end='12-30-2013'), 0)
+
+    def test_times_are_stored_in_utc(self):
+        self.store.upsert([
+            {'service_request_id': 1,
+             'requested_datetime': '2013-12-31T20:00:00-05:00'},
+            {'service_request_id': 2,
+             'requested_datetime': '2013-12-31T23:00:00Z'}])
+        self.assertEqual(self.store.count(end='12-31-2013'), 1)
+        self.assertEqual(self.store.count(start='01-01-2014'), 1)
+        self.assertEqual([r['service_request_id']
+                          for r in self.store.requests()], [2, 1])
+        self.assertEqual(self.store.request(1)['requested_datetime'],
+                         '2013-12-31T20:00:00-05:00')
+
+    def test_sync_starts_from_the_last_checkpoint(self):
+        self.client.session.get.side_effect = pages([], [])
+        self.store.sync(since=date(2013, 1, 1), until=date(2013, 2, 1))
+        self.store.sync(until='03-01-2013')
+        params = self.client.session.get.call_args[1]['params']
+        self.assertEqual(params['start_date'], '2013-02-01T00:00:00Z')
+        self.assertEqual(params['end_date'], '2013-03-01T00:00:00Z')
+
+
 @patch.object(req, 'Session', Mock())
 class ThreeRequests(unittest.TestCase):
 
@@ -130,6 +928,164 @@ class ThreeRequests(unittest.TestCase):
         t.session.get.assert_called_with(expected, params=params)
 
 
+def pages(*pages):
+    """Mock responses for a series of JSON pages."""
+    return [Mock(content=json.dumps(page), status_code=200) for page in pages]
+
+
+@patch.object(req, 'Session', Mock())
+class ThreeIterRequests(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+
+    def test_iter_requests_walks_every_page(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.side_effect = pages([{'id': 1}, {'id': 2}],
+                                          [{'id': 3}, {'id': 4}],
+                                          [{'id': 5}])
+        records = list(t.iter_requests(count=2))
+        self.assertEqual([r['id'] for r in records], [1, 2, 3, 4, 5])
+        expected = 'https://api.city.gov/requests.json'
+        params = {'page': 3, 'page_size': 2}
+        t.session.get.assert_called_with(expected, params=params)
+
+    def test_iter_requests_stops_on_empty_page(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.side_effect = pages([{'id': 1}, {'id': 2}], [])
+        records = list(t.iter_requests('123'))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(t.session.get.call_count, 2)
+
+    def test_iter_requests_stops_on_repeated_page(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.side_effect = pages([{'id': 1}], [{'id': 1}])
+        records = list(t.iter_requests())
+        self.assertEqual(records, [{'id': 1}])
+
+    def test_iter_requests_stops_on_a_short_first_page(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.side_effect = pages([{'id': 1}, {'id': 2}])
+        records = list(t.iter_requests(count=10))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(t.session.get.call_count, 1)
+
+    def test_iter_requests_with_a_server_capped_page_size(self):
+        t = Three('api.city.gov', cap=50)
+        t.session = Mock()
+        ids = list(range(250))
+        # The server only returns 50 at a time, whatever was asked for.
+        t.session.get.side_effect = lambda url, params: Mock(
+            content=json.dumps(ids[(params['page'] - 1) * 50:
+                                   params['page'] * 50]))
+        records = list(t.iter_requests(count=100, workers=2))
+        self.assertEqual(records, ids)
+
+    def test_pages_keeps_page_order(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        replies = dict((n, Mock(content=json.dumps([{'id': n}])))
+                       for n in range(2, 6))
+        t.session.get.side_effect = lambda url, params: \
+            replies[params['page']]
+        records = t.pages(first=2, last=5, workers=3)
+        self.assertEqual([r['id'] for r in records], [2, 3, 4, 5])
+        self.assertEqual(t.session.get.call_count, 4)
+
+    def test_pages_without_last_stops_on_short_page(self):
+        t = Three('api.city.gov')
+        t.session = Mock()
+        t.session.get.side_effect = lambda url, params: Mock(
+            content=json.dumps([{'id': params['page']}] *
+                               (2 if params['page'] < 3 else 1)))
+        records = t.pages(count=2, workers=2)
+        self.assertEqual([r['id'] for r in records], [1, 1, 2, 2, 3])
+
+
+class ThreeSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.t = Three('api.city.gov')
+        self.t.session = Mock()
+        self.t.session.get.side_effect = self.server
+        self.records = [self.record(id) for id in range(9, 0, -1)]
+        self.inserts = {}
+        self.removals = {}
+
+    def record(self, id):
+        return {'service_request_id': id,
+                'requested_datetime': '2013-01-%02dT00:00:00Z' % id}
+
+    def server(self, url, params):
+        # Newest first, three to a page, within the dates asked for.
+        records = [r for r in self.records
+                   if params.get('start_date', '') <=
+                   r['requested_datetime'] <= params['end_date']]
+        start = (params['page'] - 1) * 3
+        page = records[start:start + 3]
+        if 'start_date' not in params:
+            for record in self.inserts.pop(params['page'], []):
+                self.records.append(record)
+                self.records.sort(key=lambda r: r['requested_datetime'],
+                                  reverse=True)
+            for id in self.removals.pop(params['page'], []):
+                self.records = [r for r in self.records
+                                if r['service_request_id'] != id]
+        return Mock(content=json.dumps(page))
+
+    def pages(self):
+        return [call[1]['params']['page']
+                for call in self.t.session.get.call_args_list
+                if 'start_date' not in call[1]['params']]
+
+    def ids(self, **kwargs):
+        return [r['service_request_id']
+                for r in self.t.snapshot(count=3, **kwargs)]
+
+    def test_the_end_date_is_pinned(self):
+        self.assertEqual(self.ids(at=datetime(2013, 2, 1, 12)),
+                         list(range(9, 0, -1)))
+        for call in self.t.session.get.call_args_list:
+            if 'start_date' not in call[1]['params']:
+                self.assertEqual(call[1]['params']['end_date'],
+                                 '2013-02-01T12:00:00Z')
+
+    def test_no_extra_requests_without_drift(self):
+        self.assertEqual(self.ids(), list(range(9, 0, -1)))
+        self.assertEqual(self.t.session.get.call_count, 4)
+
+    def test_boundary_pages_are_fetched_again_on_drift(self):
+        # A late arrival shifts everything down a place after page one.
+        self.inserts[1] = [dict(self.record(8), service_request_id=10)]
+        ids = self.ids()
+        self.assertEqual(sorted(ids), list(range(1, 11)))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(self.pages()[:3], [1, 2, 1])
+
+    def test_pages_are_fetched_again_until_their_bounds_hold(self):
+        # A late arrival on page one only shows up as a duplicate on
+        # page three, so pages two and one both have to be checked.
+        self.inserts[2] = [dict(self.record(8), service_request_id=10)]
+        ids = self.ids()
+        self.assertEqual(sorted(ids), list(range(1, 11)))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(self.pages()[:5], [1, 2, 3, 2, 1])
+
+    def test_records_dropping_out_are_caught_at_the_seams(self):
+        # Closing 8 pulls 6 back onto page one, with no duplicate and
+        # nothing out of order on page two.
+        self.removals[1] = [8]
+        ids = self.ids(status='open')
+        self.assertEqual(sorted(ids), list(range(1, 10)))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(self.pages(), [1, 2, 3])
+
+
 @patch.object(req, 'Session', Mock())
 class ThreeRequest(unittest.TestCase):
 
@@ -237,6 +1193,66 @@ class ThreePost(unittest.TestCase):
         t.session.post.assert_called_with(expected, data=params, files=None)
 
 
+class ThreeSubmit(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.directory = tempfile.mkdtemp()
+        self.photo = os.path.join(self.directory, 'photo.png')
+        with open(self.photo, 'wb') as f:
+            f.write(b'\x89PNG' * 1000)
+        self.t = Three('api.city.gov', api_key='my_api_key')
+        self.t.session = Mock()
+        self.t.session.post.side_effect = lambda url, **kwargs: Mock(
+            content='[{"token": "abc"}]', status_code=201)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_multipart_stream_reads_files_in_chunks(self):
+        body = MultipartStream({'service_code': '123'},
+                               {'media': self.photo}, chunk_size=1000)
+        chunks = list(body)
+        content = b''.join(chunks)
+        self.assertEqual(len(content), len(body))
+        self.assertTrue(max(len(chunk) for chunk in chunks) <= 1000)
+        self.assertTrue(b'name="service_code"\r\n\r\n123\r\n' in content)
+        self.assertTrue(b'filename="photo.png"\r\n'
+                        b'Content-Type: image/png' in content)
+        self.assertEqual(b''.join(body), content)
+
+    def test_post_streams_media(self):
+        self.t.post('123', media=self.photo)
+        kwargs = self.t.session.post.call_args[1]
+        self.assertTrue(isinstance(kwargs['data'], MultipartStream))
+        self.assertTrue(kwargs['headers']['Content-Type'].startswith(
+            'multipart/form-data; boundary='))
+
+    def test_post_sends_other_media_as_files(self):
+        unseekable = Mock(spec=['read', 'seekable'])
+        unseekable.seekable.return_value = False
+        for media in (b'\x89PNG', ('photo.png', b'\x89PNG', 'image/png'),
+                      unseekable):
+            self.t.post('123', media=media)
+            kwargs = self.t.session.post.call_args[1]
+            self.assertEqual(kwargs['files'], {'media': media})
+
+    def test_submit_skips_duplicates(self):
+        ledger = os.path.join(self.directory, 'ledger.json')
+        reports = [{'service_code': '1', 'description': 'Pothole'},
+                   {'service_code': '1', 'description': 'Pothole'},
+                   {'service_code': '2', 'media': self.photo}]
+        results = list(self.t.submit(reports, workers=2, ledger=ledger))
+        self.assertEqual([r['status'] for r in results], [201, 201, 201])
+        self.assertEqual([r['duplicate'] for r in results],
+                         [False, True, False])
+        self.assertEqual(self.t.session.post.call_count, 2)
+        again = list(self.t.submit(reports[:1], ledger=ledger))
+        self.assertTrue(again[0]['duplicate'])
+        self.assertEqual(self.t.session.post.call_count, 2)
+        self.assertEqual(len(Ledger(ledger).results), 2)
+
+
 @patch.object(req, 'Session', Mock())
 class ThreeToken(unittest.TestCase):
 
@@ -250,6 +1266,96 @@ class ThreeToken(unittest.TestCase):
         t.session.get.assert_called_with(expected, params={})
 
 
+@unittest.skipIf(AsyncThree is None, 'aiohttp is not installed')
+class ThreeAsync(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.session = Mock()
+        self.response = Mock(status=200)
+        self.response.read = AsyncMock(return_value=b'[{"id": 1}]')
+        self.session.request = AsyncMock(return_value=self.response)
+
+    def run_async(self, t, method, *args, **kwargs):
+        t.aiohttp_session = self.session
+        return asyncio.run(getattr(t, method)(*args, **kwargs))
+
+    def test_async_requests_call(self):
+        t = AsyncThree('api.city.gov')
+        data = self.run_async(t, 'requests', '123', status='open')
+        self.assertEqual(data, [{'id': 1}])
+        expected = 'https://api.city.gov/requests.json'
+        params = {'service_code': '123', 'status': 'open'}
+        self.session.request.assert_called_with('GET', expected,
+                                                params=params)
+        self.assertTrue(self.response.release.called)
+
+    def test_async_token_call(self):
+        t = AsyncThree('api.city.gov')
+        self.run_async(t, 'token', '12345')
+        expected = 'https://api.city.gov/tokens/12345.json'
+        self.session.request.assert_called_with('GET', expected, params={})
+
+    def test_async_post_converts_content(self):
+        t = AsyncThree('api.city.gov', api_key='my_api_key')
+        data = self.run_async(t, 'post', '123', name='Zach Williams')
+        self.assertEqual(data, [{'id': 1}])
+        method, url = self.session.request.call_args[0]
+        self.assertEqual((method, url),
+                         ('POST', 'https://api.city.gov/requests.json'))
+
+    def test_only_awaitable_methods_are_exposed(self):
+        t = AsyncThree('api.city.gov')
+        for name in ('pages', 'iter_requests', 'request_many', 'backfill',
+                     'snapshot', 'submit', 'stream', 'session'):
+            self.assertFalse(hasattr(t, name), name)
+
+    def test_reset_closes_the_old_session(self):
+        t = AsyncThree('api.city.gov')
+        self.session.close = AsyncMock()
+        t.aiohttp_session = self.session
+        t.reset()
+        self.assertTrue(t.aiohttp_session is None)
+        asyncio.run(t.close())
+        self.assertTrue(self.session.close.called)
+
+
+class CommandLine(unittest.TestCase):
+
+    def setUp(self):
+        core.json = json
+        self.session = Mock()
+        self.session.get.side_effect = pages(
+            [{'service_request_id': 1, 'status': 'open', 'extra': 'x'},
+             {'service_request_id': 2, 'status': 'closed'}], [])
+        self.patch = patch.object(req, 'Session',
+                                  Mock(return_value=self.session))
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def export(self, *argv):
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            cli.main(list(argv))
+            return stdout.getvalue()
+
+    def test_ndjson_export(self):
+        output = self.export('macon', '--start', '03-01-2012',
+                             '--end', '03-05-2012')
+        lines = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([line['service_request_id'] for line in lines],
+                         [1, 2])
+        params = self.session.get.call_args[1]['params']
+        self.assertEqual(params['start_date'], '2012-03-01T00:00:00Z')
+
+    def test_csv_export(self):
+        output = self.export('macon', '--format', 'csv',
+                             '--fields', 'service_request_id,status')
+        self.assertEqual(output.splitlines(),
+                         ['service_request_id,status', '1,open', '2,closed'])
+
+
 class TopLevelFunctions(unittest.TestCase):
 
     def setUp(self):
@@ -258,6 +1364,10 @@ class TopLevelFunctions(unittest.TestCase):
                                   Mock(return_value=self.session))
         self.patch.start()
         core.json = MagicMock()
+        self.xml = patch.object(core, 'xml',
+                                Mock(return_value={'root': {}}))
+        self.xml.start()
+        three.api.reset_clients()
 
     def tearDown(self):
         self.patch.stop()
@@ -304,6 +1414,46 @@ class TopLevelFunctions(unittest.TestCase):
         three.services()
         self.assertTrue(self.session.get.called)
 
+    def test_three_fan_out(self):
+        results = dict(three.fan_out('services', ['sf', 'macon'], workers=2))
+        self.assertEqual(sorted(results), ['macon', 'sf'])
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_three_fan_out_yields_errors(self):
+        results = dict(three.fan_out('services', ['macon', 'made up']))
+        self.assertTrue(isinstance(results['made up'], CityNotFound))
+        self.assertFalse(isinstance(results['macon'], Exception))
+
+    def test_fan_out_shares_clients_with_city(self):
+        list(three.fan_out('services', ['SF']))
+        three.city('sf')
+        self.assertEqual(len(three.api._clients), 1)
+        self.assertEqual(req.Session.call_count, 1)
+
+    def test_clients_are_reused(self):
+        first = three.city('macon')
+        three.requests()
+        three.services()
+        self.assertTrue(three.city('macon') is first)
+        self.assertEqual(req.Session.call_count, 1)
+
+    def test_clients_differ_by_api_key(self):
+        first = three.city('macon')
+        three.key('another_key')
+        self.assertFalse(three.city('macon') is first)
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'needs contextvars')
+    def test_city_is_kept_per_context(self):
+        import contextvars
+        three.city('macon')
+        context = contextvars.copy_context()
+        context.run(three.city, 'sf')
+        sf = context.run(three.api._client)
+        self.assertEqual(sf.endpoint, 'https://open311.sfgov.org/V2/')
+        macon = three.api._client()
+        self.assertEqual(macon.endpoint,
+                         'http://seeclickfix.com/macon/open311/')
+
     def test_three_dev_functionality(self):
         three.dev('http://api.city.gov')
         environ = os.environ['OPEN311_CITY_INFO']
@@ -317,6 +1467,7 @@ class TopLevelFunctions(unittest.TestCase):
         self.assertEqual(environ, expected)
 
     def tearDown(self):
+        self.xml.stop()
         os.environ['OPEN311_API_KEY'] = ''
         os.environ['OPEN311_CITY_INFO'] = ''
 
@@ -1,5 +1,13 @@
 from . import core
-from .api import (key, city, cities, dev, discovery, post, request,
-                  requests, services, token)
+from .api import (key, city, cities, dev, discovery, fan_out, post,
+                  request, requests, services, token)
+from .cache import Cache
+from .cassette import Cassette, CassetteMiss
 from .cities import CityNotFound
 from .core import Three
+from .index import RequestIndex
+from .metrics import Metrics
+from .records import ServiceRequest
+from .store import Store
+from .submit import Ledger, submit
+from .tokens import TokenResolver
@@ -0,0 +1,172 @@
+"""
+An asyncio flavor of the Three wrapper, built on aiohttp.
+
+>>> from three.aio import AsyncThree
+>>> async with AsyncThree('api.city.gov') as t:
+...     await t.services()
+"""
+
+import asyncio
+
+import aiohttp
+from relaxml import xml
+
+from .core import Open311
+
+
+class AsyncThree(Open311):
+    """
+    Interact with the Open311 API from an event loop. URLs, parameters and
+    conversion are shared with `Three`, but only the basic calls are
+    available, every one of them is awaitable, and they all go through
+    one aiohttp connection pool.
+    """
+
+    def configure(self, endpoint=None, **kwargs):
+        """Configure a previously initialized instance of the class."""
+        keywords = self._settings(endpoint, **kwargs)
+        self.pool_size = max(int(keywords['pool_size'] or 0), 100)
+        # A session can only be closed from inside the event loop, so the
+        # old one is closed on the next call.
+        retired = getattr(self, '_retired', [])
+        session = getattr(self, 'aiohttp_session', None)
+        if session is not None:
+            retired.append(session)
+        self._retired = retired
+        self.aiohttp_session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying connection pool."""
+        await self._close_retired()
+        if self.aiohttp_session is not None:
+            await self.aiohttp_session.close()
+            self.aiohttp_session = None
+
+    async def _close_retired(self):
+        """Close any sessions left over from before `configure`."""
+        while self._retired:
+            await self._retired.pop().close()
+
+    def _session(self):
+        """
+        Lazily create the aiohttp session, since it needs a running event
+        loop.
+        """
+        if self.aiohttp_session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.aiohttp_session = aiohttp.ClientSession(connector=connector)
+        return self.aiohttp_session
+
+    async def _read(self, method, url, **kwargs):
+        """Send a request and read back the full response body."""
+        await self._close_retired()
+        if self.limiter is not None:
+            delay = self.limiter.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+        response = await self._session().request(method, url, **kwargs)
+        try:
+            content = await response.read()
+        finally:
+            response.release()
+        return response, content
+
+    async def get(self, *args, **kwargs):
+        """Perform a get request."""
+        if 'convert' in kwargs:
+            conversion = kwargs.pop('convert')
+        else:
+            conversion = True
+        kwargs = self._get_keywords(**kwargs)
+        url = self._create_path(*args)
+        response, content = await self._read('GET', url, params=kwargs)
+        self._request = response
+        return self.convert(content, conversion)
+
+    async def discovery(self, url=None):
+        """
+        Retrieve the standard discovery file that provides routing
+        information.
+
+        >>> await AsyncThree().discovery()
+        {'discovery': 'data'}
+        """
+        if url:
+            response, data = await self._read('GET', url)
+        elif self.discovery_url:
+            response, content = await self._read('GET', self.discovery_url)
+            if self.format == 'xml':
+                # Because, SF doesn't follow the spec.
+                data = xml(content)
+            else:
+                # Spec calls for discovery always allowing JSON.
+                data = self.convert(content, True)
+        else:
+            data = await self.get('discovery')
+        return data
+
+    async def services(self, code=None, **kwargs):
+        """
+        Retrieve information about available services.
+
+        >>> await AsyncThree('api.city.gov').services('033')
+        {'033': {'service_code': 'data'}}
+        """
+        return await self.get('services', code, **kwargs)
+
+    async def requests(self, code=None, **kwargs):
+        """
+        Retrieve open requests. You can also enter a specific service code
+        argument.
+
+        >>> await AsyncThree('api.city.gov').requests('123')
+        {'123': {'requests': 'data'}}
+        """
+        if code:
+            kwargs['service_code'] = code
+        return await self.get('requests', **kwargs)
+
+    async def request(self, id, **kwargs):
+        """
+        Retrieve a specific request using its service code ID.
+
+        >>> await AsyncThree('api.city.gov').request('12345')
+        {'request': {'service_code': {'12345': 'data'}}}
+        """
+        return await self.get('requests', id, **kwargs)
+
+    async def token(self, id, **kwargs):
+        """
+        Retrieve a service request ID from a token.
+
+        >>> await AsyncThree('api.city.gov').token('12345')
+        {'service_request_id': {'for': {'token': '12345'}}}
+        """
+        return await self.get('tokens', id, **kwargs)
+
+    async def post(self, service_code='0', **kwargs):
+        """
+        Post a new Open311 request.
+
+        >>> t = AsyncThree('api.city.gov')
+        >>> await t.post('123', address='123 Any St', name='Zach Williams',
+        ...              description='My issue description.')
+        {'successful': {'request': 'post'}}
+        """
+        kwargs['service_code'] = service_code
+        kwargs = self._post_keywords(**kwargs)
+        media = kwargs.pop('media', None)
+        data = aiohttp.FormData(kwargs)
+        if media:
+            data.add_field('media', media)
+        url = self._create_path('requests')
+        response, content = await self._read('POST', url, data=data)
+        self.post_response = response
+        conversion = response.status < 500
+        return self.convert(content, conversion)
@@ -3,21 +3,76 @@ Simple, top-level functions for working with the Open311 API.
 """
 
 import os
-from simplejson import dumps
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+from simplejson import dumps, loads
 
 from .cities import find_info
 from .core import Three
 
+try:
+    from contextvars import ContextVar
+except ImportError:
+    # Python < 3.7, where there's a single, global context.
+    class ContextVar(object):
+        def __init__(self, name, default=None):
+            self.value = default
+
+        def get(self):
+            return self.value
+
+        def set(self, value):
+            self.value = value
+
+
+# The city and API key for the current thread or task. When they haven't
+# been set in this context, the environment variables are used instead.
+_city_info = ContextVar('open311_city_info', default=None)
+_api_key = ContextVar('open311_api_key', default=None)
+
+# Clients are reused for the same city and API key, so that their
+# connections (and parsed settings) carry over from call to call.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client(info=None, api_key=None):
+    """Find or create the shared client for a city and API key."""
+    if info is None:
+        info = _city_info.get() or os.environ.get('OPEN311_CITY_INFO', '')
+    if api_key is None:
+        api_key = _api_key.get() or os.environ.get('OPEN311_API_KEY', '')
+    client = _clients.get((info, api_key))
+    if client is None:
+        with _clients_lock:
+            client = _clients.get((info, api_key))
+            if client is None:
+                kwargs = loads(info) if info else {}
+                kwargs.setdefault('api_key', api_key)
+                client = Three(**kwargs)
+                _clients[(info, api_key)] = client
+    return client
+
+
+def reset_clients():
+    """Forget every shared client, closing their connections."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
+
 
 def key(key=None):
     """
-    Save your API key to the global environment.
+    Save your API key for the current context, as well as the global
+    environment.
 
     >>> three.api_key('my_api_key')
     """
     if key:
         os.environ['OPEN311_API_KEY'] = key
-    return os.environ['OPEN311_API_KEY']
+        _api_key.set(key)
+    return _api_key.get() or os.environ['OPEN311_API_KEY']
 
 
 def city(name=None):
@@ -26,9 +81,19 @@ def city(name=None):
 
     >>> three.city('sf')
     """
-    info = find_info(name)
-    os.environ['OPEN311_CITY_INFO'] = dumps(info)
-    return Three(**info)
+    return _use(_city_key(name))
+
+
+def _city_key(name):
+    """The settings for a city, keying its shared client."""
+    return dumps(dict(find_info(name), city=name.lower()))
+
+
+def _use(info):
+    """Switch the current context (and environment) to a city."""
+    os.environ['OPEN311_CITY_INFO'] = info
+    _city_info.set(info)
+    return _client(info)
 
 
 def cities():
@@ -44,8 +109,51 @@ def dev(endpoint, **kwargs):
     development.
     """
     kwargs['endpoint'] = endpoint
-    os.environ['OPEN311_CITY_INFO'] = dumps(kwargs)
-    return Three(**kwargs)
+    return _use(dumps(kwargs))
+
+
+def fan_out(method, cities=None, workers=8, timeout=None, **kwargs):
+    """
+    Call the same method against many cities at once, yielding
+    `(city, result)` pairs as each one completes. Every city uses its own
+    shared client (and connection pool), at most `workers` calls run at a time,
+    and a failing city yields its exception instead of a result. Cities
+    still running after `timeout` seconds yield a `TimeoutError`.
+
+    >>> for city, result in three.fan_out('requests', ['sf', 'macon']):
+    ...     print(city, result)
+    """
+    if cities is None:
+        cities = find_info()
+    api_key = _api_key.get() or os.environ.get('OPEN311_API_KEY', '')
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = dict((executor.submit(_call_city, name, method, api_key,
+                                    kwargs), name)
+                   for name in cities)
+    remaining = set(futures.values())
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            name = futures[future]
+            remaining.discard(name)
+            try:
+                result = future.result()
+            except Exception as error:
+                result = error
+            yield name, result
+    except TimeoutError:
+        for name in cities:
+            if name in remaining:
+                yield name, TimeoutError("Timed out querying %s" % name)
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _call_city(name, method, api_key, kwargs):
+    """Call a `Three` method for a single city."""
+    client = _client(_city_key(name), api_key)
+    return getattr(client, method)(**kwargs)
 
 
 def discovery(path=None, **kwargs):
@@ -55,7 +163,7 @@ def discovery(path=None, **kwargs):
     >>> three.city('sf')
     >>> three.discovery()
     """
-    return Three().discovery(path, **kwargs)
+    return _client().discovery(path, **kwargs)
 
 
 def post(code=None, **kwargs):
@@ -67,7 +175,7 @@ def post(code=None, **kwargs):
     ...            phone='555-5555', description='My issue description'.)
     {'successful': {'request': 'post'}}
     """
-    return Three().post(code, **kwargs)
+    return _client().post(code, **kwargs)
 
 
 def request(code, **kwargs):
@@ -77,7 +185,7 @@ def request(code, **kwargs):
     >>> three.city('sf')
     >>> three.request('12345')
     """
-    return Three().request(code, **kwargs)
+    return _client().request(code, **kwargs)
 
 
 def requests(code=None, **kwargs):
@@ -87,7 +195,7 @@ def requests(code=None, **kwargs):
     >>> three.city('sf')
     >>> three.requests()
     """
-    return Three().requests(code, **kwargs)
+    return _client().requests(code, **kwargs)
 
 
 def services(code=None, **kwargs):
@@ -97,7 +205,7 @@ def services(code=None, **kwargs):
     >>> three.city('sf')
     >>> three.services()
     """
-    return Three().services(code, **kwargs)
+    return _client().services(code, **kwargs)
 
 
 def token(code, **kwargs):
@@ -107,4 +215,4 @@ def token(code, **kwargs):
     >>> three.city('sf')
     >>> three.token('123abc')
     """
-    return Three().token(code, **kwargs)
+    return _client().token(code, **kwargs)
@@ -0,0 +1,96 @@
+"""
+An in-memory response cache for the near-static parts of the Open311 API.
+
+>>> from three import Three, Cache
+>>> t = Three('api.city.gov', cache=Cache(size=256, ttls={'services': 3600}))
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class Entry(object):
+    """Converted content for a single URL, along with its validators."""
+    __slots__ = ('data', 'expires', 'etag', 'modified')
+
+    def __init__(self, data, ttl, etag=None, modified=None):
+        self.data = data
+        self.etag = etag
+        self.modified = modified
+        self.refresh(ttl)
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires
+
+    def refresh(self, ttl):
+        """Mark the entry as fresh for another `ttl` seconds."""
+        self.expires = time.time() + ttl
+
+    def validators(self):
+        """Headers used to revalidate a stale entry."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.modified:
+            headers['If-Modified-Since'] = self.modified
+        return headers
+
+
+class Cache(object):
+    """
+    A size-bound LRU cache of converted responses. Only the near-static
+    `resources` (the first part of the path, `services` and `discovery`
+    by default) and any resource given a time in `ttls` are cached, so
+    requests and tokens always hit the network unless you ask otherwise.
+    Entries live for `ttl` seconds, or for their resource's time in
+    `ttls`. Stale entries with an ETag or Last-Modified header are
+    revalidated, so an unchanged resource comes back from the cache.
+
+    Cached data is shared between callers, so treat it as read-only.
+    """
+
+    def __init__(self, size=128, ttl=300, ttls=None,
+                 resources=('services', 'discovery')):
+        self.size = size
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.resources = frozenset(resources) | frozenset(self.ttls)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, url, params=None, variant=None):
+        """Build a cache key from a URL and its query parameters."""
+        params = tuple(sorted((params or {}).items()))
+        return (url, params, variant)
+
+    def caches(self, resource):
+        """Whether responses for a resource are cached at all."""
+        return resource in self.resources
+
+    def ttl_for(self, resource):
+        """Find the time to live for a resource."""
+        return self.ttls.get(resource, self.ttl)
+
+    def get(self, key):
+        """Find an entry, fresh or not, and mark it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.pop(key)
+                self._entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        """Store an entry, evicting the least recently used ones."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,145 @@
+"""
+Record raw responses to a compressed archive, and replay them offline.
+
+>>> from three import Three, Cassette
+>>> with Cassette('macon.zip') as cassette:
+...     t = Three('seeclickfix.com/macon/open311/', cassette=cassette)
+...     t.requests(start='01-01-2013', end='01-31-2013')
+"""
+
+import os
+import threading
+import zipfile
+
+import requests
+import simplejson as json
+
+try:
+    # Python 2
+    from urllib import urlencode
+except ImportError:
+    # Python 3
+    from urllib.parse import urlencode
+
+
+INDEX = 'index.json'
+
+# Parameters left out of keys, so that secrets never end up in an archive
+# and replays work with any key.
+IGNORED = ('api_key',)
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class Cassette(object):
+    """
+    A zip archive of raw responses, indexed by method, URL and sorted
+    query or form parameters. In `record` mode every call goes out to the
+    network and its response is added to the archive, replacing any
+    earlier one for the same call; in `replay` mode responses only come
+    from the archive, and a call that was never recorded raises
+    `CassetteMiss`. Without a `mode`, an existing archive is replayed and
+    a new one is recorded.
+
+    Recordings are written out when the cassette is closed, so use it
+    as a context manager or call `close`.
+    """
+
+    def __init__(self, path, mode=None):
+        if mode is None:
+            mode = 'replay' if os.path.exists(path) else 'record'
+        if mode not in ('record', 'replay'):
+            raise ValueError("mode must be 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.index = {}
+        self._archive = None
+        self._recording = None
+        self._written = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._archive = zipfile.ZipFile(path)
+            self.index = json.loads(self._archive.read(INDEX).decode('utf-8'))
+        elif mode == 'replay':
+            raise IOError("No cassette at %s" % path)
+        if mode == 'record':
+            self._recording = zipfile.ZipFile(path + '.tmp', 'w',
+                                              zipfile.ZIP_DEFLATED)
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def key(self, method, url, kwargs):
+        """Build the index key for a call."""
+        params = kwargs.get('params') or kwargs.get('data')
+        if not isinstance(params, dict):
+            # Multipart uploads are only keyed by their URL.
+            params = {}
+        pairs = sorted((str(name), str(value))
+                       for name, value in params.items()
+                       if value is not None and name not in IGNORED)
+        return '%s %s?%s' % (method.upper(), url, urlencode(pairs))
+
+    def play(self, method, url, **kwargs):
+        """Answer a call with its recorded response."""
+        key = self.key(method, url, kwargs)
+        entry = self.index.get(key)
+        if entry is None:
+            raise CassetteMiss(key)
+        with self._lock:
+            content = self._archive.read(entry['name'])
+        response = requests.models.Response()
+        response.status_code = entry['status']
+        response.headers.update(entry['headers'])
+        response.url = url
+        response.encoding = entry.get('encoding')
+        response._content = content
+        response._content_consumed = True
+        return response
+
+    def record(self, method, url, kwargs, response):
+        """Add a response to the archive."""
+        key = self.key(method, url, kwargs)
+        content = response.content
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        with self._lock:
+            name = self._write(content)
+            self.index[key] = {'name': name, 'status': response.status_code,
+                               'headers': dict(response.headers),
+                               'encoding': response.encoding}
+            self._written.add(key)
+
+    def _write(self, content):
+        """Store a body under the next free name."""
+        name = 'responses/%06d' % len(self._recording.namelist())
+        self._recording.writestr(name, content)
+        return name
+
+    def close(self):
+        """Write out the archive, keeping earlier recordings."""
+        with self._lock:
+            if self._recording is not None:
+                for key, entry in sorted(self.index.items()):
+                    if key not in self._written:
+                        content = self._archive.read(entry['name'])
+                        entry['name'] = self._write(content)
+                self._recording.writestr(INDEX, json.dumps(self.index))
+                self._recording.close()
+                self._recording = None
+                if self._archive is not None:
+                    self._archive.close()
+                    self._archive = None
+                os.rename(self.path + '.tmp', self.path)
+            elif self._archive is not None:
+                self._archive.close()
+                self._archive = None
@@ -0,0 +1,89 @@
+"""
+Export a city's service requests from the command line.
+
+    $ three macon --start 03-01-2012 --end 03-31-2012 --format csv > macon.csv
+"""
+
+import argparse
+import csv
+import sys
+
+import simplejson as json
+
+from .cities import CityNotFound, find_info
+from .core import Three
+from .records import FIELDS
+
+
+def main(argv=None):
+    """Stream every matching request to NDJSON or CSV."""
+    parser = argparse.ArgumentParser(
+        prog='three',
+        description="Export a city's Open311 service requests.")
+    parser.add_argument('city', help="a city from the `three.cities()` list")
+    parser.add_argument('--start', help="first date, like 03-01-2012")
+    parser.add_argument('--end', help="last date (defaults to today)")
+    parser.add_argument('--code', help="only export this service code")
+    parser.add_argument('--status', help="only export this status")
+    parser.add_argument('--format', choices=('ndjson', 'csv'),
+                        default='ndjson')
+    parser.add_argument('--fields', help="comma separated CSV columns")
+    parser.add_argument('--count', type=int, help="requests per page")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="pages to fetch at once")
+    parser.add_argument('--output', type=argparse.FileType('w'),
+                        default=sys.stdout)
+    args = parser.parse_args(argv)
+    if args.end and not args.start:
+        parser.error("--end needs a --start date")
+
+    try:
+        info = find_info(args.city)
+    except CityNotFound as error:
+        parser.error(str(error))
+    kwargs = {}
+    if args.start:
+        kwargs['start'] = args.start
+    if args.end:
+        kwargs['end'] = args.end
+    if args.status:
+        kwargs['status'] = args.status
+    if args.count:
+        kwargs['count'] = args.count
+    client = Three(city=args.city, **info)
+    records = client.iter_requests(args.code, workers=args.workers,
+                                   **kwargs)
+
+    if args.format == 'csv':
+        fields = args.fields.split(',') if args.fields else FIELDS
+        write_csv(records, args.output, fields)
+    else:
+        write_ndjson(records, args.output)
+    args.output.flush()
+
+
+def write_ndjson(records, output):
+    """Write one JSON object per line, as each record arrives."""
+    for record in records:
+        output.write(json.dumps(record))
+        output.write('\n')
+
+
+def write_csv(records, output, fields):
+    """Write records as CSV rows, as each one arrives."""
+    writer = csv.DictWriter(output, fields, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(dict((field, _cell(record.get(field)))
+                             for field in fields))
+
+
+def _cell(value):
+    """Flatten empty XML elements, since they come through as dicts."""
+    if value == {}:
+        return ''
+    return value
+
+
+if __name__ == '__main__':
+    main()
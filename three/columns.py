@@ -0,0 +1,137 @@
+"""
+Columnar, NumPy-backed batches of service requests for analytics.
+
+>>> from three import Three
+>>> for batch in Three('api.city.gov').batches(size=10000):
+...     print(batch['service_code'].counts())
+"""
+
+from itertools import islice
+
+from .records import DATETIMES, FLOATS, parse_datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+CATEGORICALS = ('status', 'service_code')
+STRINGS = ('service_request_id', 'service_name', 'address')
+
+
+class Categorical(object):
+    """
+    A dictionary-encoded column: an integer code for every row and the
+    distinct values those codes point to. Missing values get a code of -1.
+    """
+    __slots__ = ('codes', 'categories')
+
+    def __init__(self, values):
+        lookup = {}
+        categories = []
+
+        def encode(value):
+            if value is None or value == {}:
+                return -1
+            value = str(value)
+            if value not in lookup:
+                lookup[value] = len(categories)
+                categories.append(value)
+            return lookup[value]
+
+        self.codes = np.fromiter((encode(value) for value in values),
+                                 dtype=np.int32)
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def mask(self, value):
+        """A boolean array of the rows equal to `value`."""
+        if value not in self.categories:
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == self.categories.index(value)
+
+    def counts(self):
+        """Count how many rows have each value."""
+        present = self.codes[self.codes >= 0]
+        totals = np.bincount(present, minlength=len(self.categories))
+        return dict(zip(self.categories, totals.tolist()))
+
+    def values(self):
+        """Decode back into a list of values."""
+        categories = self.categories
+        return [categories[code] if code >= 0 else None
+                for code in self.codes.tolist()]
+
+
+class Batch(object):
+    """
+    A batch of service requests stored column by column. Latitude and
+    longitude are `float64` arrays (NaN when missing), datetimes are UTC
+    `datetime64[s]` arrays (NaT when missing), status and service code
+    are `Categorical` columns, and a few identifying fields are kept as
+    object arrays.
+    """
+
+    def __init__(self, records):
+        if np is None:
+            raise ImportError("NumPy is needed for columnar batches.")
+        self.columns = {}
+        for name in FLOATS:
+            self.columns[name] = np.array(
+                [_float(record.get(name)) for record in records],
+                dtype=np.float64)
+        for name in DATETIMES:
+            self.columns[name] = np.array(
+                [_datetime64(record.get(name)) for record in records],
+                dtype='datetime64[s]')
+        for name in CATEGORICALS:
+            self.columns[name] = Categorical(
+                record.get(name) for record in records)
+        for name in STRINGS:
+            column = np.empty(len(records), dtype=object)
+            column[:] = [record.get(name) for record in records]
+            self.columns[name] = column
+        self.size = len(records)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def counts(self, name):
+        """Count rows per value of a categorical column."""
+        return self.columns[name].counts()
+
+
+def batches(records, size=10000):
+    """
+    Group an iterable of records, like converted `requests()` content,
+    into `Batch` objects of up to `size` rows.
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            break
+        yield Batch(chunk)
+
+
+def _float(value):
+    """Parse a coordinate, using NaN for missing values."""
+    if value is None or value == '' or value == {}:
+        return np.nan
+    return float(value)
+
+
+def _datetime64(value):
+    """Parse a timestamp into a naive UTC datetime, or NaT."""
+    if value is None or value == '' or value == {}:
+        return np.datetime64('NaT')
+    value = parse_datetime(value)
+    if value.tzinfo is not None:
+        value = (value - value.utcoffset()).replace(tzinfo=None)
+    return np.datetime64(value.replace(microsecond=0))
@@ -2,22 +2,37 @@
 A new Python wrapper for interacting with the Open311 API.
 """
 
+import math
 import os
+import random
 import re
-from collections import defaultdict
-from datetime import date
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 
 
 import requests
 from relaxml import xml
 import simplejson as json
 
+from .cache import Cache, Entry
+from .cassette import Cassette
+from .columns import batches
+from .geo import distance, location
+from .ratelimit import limiter
+from .records import ServiceRequest, utc_datetime
+from .stream import iter_json, iter_xml
+from .submit import MultipartStream, streamable, submit
+
 try:
     # Python 2
     from future_builtins import filter
+    from urlparse import urlparse
 except ImportError:
     # Python 3
-    pass
+    from urllib.parse import urlparse
 
 
 class SSLAdapter(requests.adapters.HTTPAdapter):
@@ -34,10 +49,40 @@ class SSLAdapter(requests.adapters.HTTPAdapter):
             ssl_version=self.ssl_version)
 
 
-class Three(object):
-    """The main class for interacting with the Open311 API."""
+class Retry(requests.packages.urllib3.util.retry.Retry):
+    """
+    A retry policy with exponential backoff and full jitter, so that many
+    clients retrying at once don't all land on a server together. A
+    `Retry-After` header, when sent, is honored instead. With a `limiter`,
+    every retry also waits for a token, so retried 429s count against the
+    rate limit too.
+    """
+
+    limiter = None
+
+    def new(self, **kwargs):
+        retry = super(Retry, self).new(**kwargs)
+        retry.limiter = self.limiter
+        return retry
+
+    def get_backoff_time(self):
+        backoff = super(Retry, self).get_backoff_time()
+        return random.uniform(0, backoff)
+
+    def sleep(self, response=None):
+        super(Retry, self).sleep(response)
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+
+class Open311(object):
+    """
+    Settings, URLs, parameters and conversion shared by the `Three` and
+    `AsyncThree` clients, which only differ in how they send requests.
+    """
 
     def __init__(self, endpoint=None, **kwargs):
+        self._local = threading.local()
         keywords = defaultdict(str)
         keywords.update(kwargs)
         if endpoint:
@@ -52,6 +97,24 @@ class Three(object):
         self._keywords = keywords
         self.configure()
 
+    @property
+    def _request(self):
+        """The last GET response received by the current thread."""
+        return getattr(self._local, 'request', None)
+
+    @_request.setter
+    def _request(self, response):
+        self._local.request = response
+
+    @property
+    def post_response(self):
+        """The last POST response received by the current thread."""
+        return getattr(self._local, 'post_response', None)
+
+    @post_response.setter
+    def post_response(self, response):
+        self._local.post_response = response
+
     def _global_api_key(self):
         """
         If a global Open311 API key is available as an environment variable,
@@ -65,6 +128,13 @@ class Three(object):
 
     def configure(self, endpoint=None, **kwargs):
         """Configure a previously initialized instance of the class."""
+        self._settings(endpoint, **kwargs)
+
+    def _settings(self, endpoint=None, **kwargs):
+        """
+        Apply the settings every client shares, returning all of the
+        keywords so that each client can set up its own transport.
+        """
         if endpoint:
             kwargs['endpoint'] = endpoint
         keywords = self._keywords.copy()
@@ -79,12 +149,19 @@ class Three(object):
         self.jurisdiction = keywords['jurisdiction']
         self.proxy = keywords['proxy']
         self.discovery_url = keywords['discovery'] or None
-
-        # Use a custom requests session and set the correct SSL version if
-        # specified.
-        self.session = requests.Session()
-        if 'ssl_version' in keywords:
-            self.session.mount('https://', SSLAdapter(keywords['ssl_version']))
+        self.workers = int(keywords['workers'] or 4)
+        self.cap = int(keywords['cap'] or 0) or None
+        self.records = bool(keywords['records'])
+        self.city = keywords['city'] or None
+        if keywords['rate_limit']:
+            # Buckets are shared by host, since cities hosted by the same
+            # provider are usually throttled together.
+            host = urlparse(self.endpoint).netloc
+            self.limiter = limiter(host, float(keywords['rate_limit']),
+                                   keywords['burst'] or None)
+        else:
+            self.limiter = None
+        return keywords
 
     def _configure_endpoint(self, endpoint):
         """Configure the endpoint with a schema and end slash."""
@@ -104,19 +181,6 @@ class Three(object):
         path = self.endpoint + '/'.join(args) + '.%s' % (self.format)
         return path
 
-    def get(self, *args, **kwargs):
-        """Perform a get request."""
-        if 'convert' in kwargs:
-            conversion = kwargs.pop('convert')
-        else:
-            conversion = True
-        kwargs = self._get_keywords(**kwargs)
-        url = self._create_path(*args)
-        request = self.session.get(url, params=kwargs)
-        content = request.content
-        self._request = request
-        return self.convert(content, conversion)
-
     def _get_keywords(self, **kwargs):
         """Format GET request parameters and keywords."""
         if self.jurisdiction and 'jurisdiction_id' not in kwargs:
@@ -137,6 +201,8 @@ class Three(object):
             start, end = self._format_dates(start, end)
             kwargs['start_date'] = start
             kwargs['end_date'] = end
+        elif 'end' in kwargs:
+            kwargs['end_date'] = self._split_date(kwargs.pop('end'))
         return kwargs
 
     def _format_dates(self, start, end):
@@ -147,13 +213,18 @@ class Three(object):
 
     def _split_date(self, time):
         """Split apart a date string."""
+        time = self._parse_date(time)
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def _parse_date(self, time):
+        """Turn a date string into a date, leaving dates untouched."""
         if isinstance(time, str):
             month, day, year = [int(t) for t in re.split(r'-|/', time)]
             if year < 100:
                 # Quick hack for dates < 2000.
                 year += 2000
             time = date(year, month, day)
-        return time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        return time
 
     def convert(self, content, conversion):
         """Convert content to Python data structures."""
@@ -169,6 +240,235 @@ class Three(object):
             data = content
         return data
 
+    def _service_requests(self, data):
+        """
+        Pull service requests out of converted content, as `ServiceRequest`
+        records when the `records` setting is on.
+        """
+        records = self._records(data)
+        if self.records:
+            records = [ServiceRequest.from_dict(record) for record in records]
+        return records
+
+    def _records(self, data):
+        """Pull a list of records out of converted content."""
+        if not data:
+            return []
+        if isinstance(data, dict) and len(data) == 1:
+            # XML content is keyed by the element name, like `request`.
+            data = list(data.values())[0]
+        if isinstance(data, dict):
+            data = [data]
+        elif not isinstance(data, list):
+            data = []
+        return data
+
+    def _parse_datetime(self, time):
+        """Turn a date string or date into a datetime."""
+        time = self._parse_date(time)
+        if not isinstance(time, datetime):
+            time = datetime(time.year, time.month, time.day)
+        return time
+
+    def _post_keywords(self, **kwargs):
+        """Configure keyword arguments for Open311 POST requests."""
+        if self.jurisdiction and 'jurisdiction_id' not in kwargs:
+            kwargs['jurisdiction_id'] = self.jurisdiction
+        if 'address' in kwargs:
+            address = kwargs.pop('address')
+            kwargs['address_string'] = address
+        if 'name' in kwargs:
+            first, last = kwargs.pop('name').split(' ')
+            kwargs['first_name'] = first
+            kwargs['last_name'] = last
+        if 'api_key' not in kwargs:
+            kwargs['api_key'] = self.api_key
+        return kwargs
+
+
+class Three(Open311):
+    """
+    The main class for interacting with the Open311 API. A configured
+    instance can be shared between threads: they all use one connection
+    pool, and the last response is tracked separately for each thread.
+    """
+    def configure(self, endpoint=None, **kwargs):
+        """Configure a previously initialized instance of the class."""
+        keywords = self._settings(endpoint, **kwargs)
+        self.hooks = list(keywords['hooks'] or [])
+        self.cassette = self._cassette(keywords['cassette'] or None)
+        self.cache = keywords['cache'] or None
+        if self.cache is True:
+            self.cache = Cache()
+
+        # Use a custom requests session, sized so that every worker thread
+        # can hold on to a connection, and set the correct SSL version if
+        # specified.
+        pool = int(keywords['pool_size'] or 0) or \
+            max(self.workers, requests.adapters.DEFAULT_POOLSIZE)
+        self.pool_size = pool
+        self.retries = self._retry_policy(keywords)
+        if isinstance(self.retries, Retry):
+            self.retries.limiter = self.limiter
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(
+            pool_maxsize=pool, max_retries=self.retries))
+        if 'ssl_version' in keywords:
+            adapter = SSLAdapter(keywords['ssl_version'], pool_maxsize=pool,
+                                 max_retries=self.retries)
+        else:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool,
+                                                    max_retries=self.retries)
+        self.session.mount('https://', adapter)
+
+    def _cassette(self, cassette):
+        """
+        Open a cassette given as a path, keeping the one already open for
+        the same path and closing it once another is configured.
+        """
+        opened = getattr(self, '_opened', None)
+        if opened is not None and opened.path != cassette:
+            opened.close()
+            opened = None
+        if isinstance(cassette, str):
+            opened = opened or Cassette(cassette)
+            cassette = opened
+        self._opened = opened
+        return cassette
+
+    def _retry_policy(self, keywords):
+        """
+        Build the retry policy for the transport. By default, GET requests
+        are retried three times on connection errors, 429s and 5xx
+        responses. POST requests are only retried with `retry_post`, since
+        they aren't idempotent.
+        """
+        retries = keywords['retries']
+        if isinstance(retries, requests.packages.urllib3.util.retry.Retry):
+            return retries
+        backoff = keywords['backoff']
+        methods = ['GET', 'HEAD']
+        if keywords['retry_post']:
+            methods.append('POST')
+        return Retry(total=3 if retries in ('', None) else int(retries),
+                     backoff_factor=0.5 if backoff in ('', None)
+                     else float(backoff),
+                     status_forcelist=(429, 500, 502, 503, 504),
+                     allowed_methods=frozenset(methods),
+                     raise_on_status=False)
+
+    def get(self, *args, **kwargs):
+        """Perform a get request."""
+        if 'convert' in kwargs:
+            conversion = kwargs.pop('convert')
+        else:
+            conversion = True
+        kwargs = self._get_keywords(**kwargs)
+        url = self._create_path(*args)
+        resource = args[0] if args else None
+        return self._fetch(resource, url,
+                           lambda r: self.convert(r.content, conversion),
+                           conversion, params=kwargs)
+
+    def stream(self, *args, **kwargs):
+        """
+        Perform a get request and yield its records one at a time. The
+        response is parsed incrementally as the body is read, rather than
+        all at once.
+
+        >>> for request in Three('api.sf.gov', format='xml').stream(
+        ...         'requests', status='open'):
+        ...     print(request['service_request_id'])
+        """
+        chunk_size = kwargs.pop('chunk_size', 64 * 1024)
+        kwargs = self._get_keywords(**kwargs)
+        url = self._create_path(*args)
+        self._throttle()
+        request = self.session.get(url, params=kwargs, stream=True)
+        self._request = request
+        try:
+            chunks = request.iter_content(chunk_size)
+            if self.format == 'xml':
+                records = iter_xml(chunks)
+            else:
+                records = iter_json(chunks)
+            for record in records:
+                yield record
+        finally:
+            request.close()
+
+    def _throttle(self):
+        """Wait for the endpoint's rate limiter, if there is one."""
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+    def _fetch(self, resource, url, parse, variant=None, **kwargs):
+        """
+        Perform a GET request and parse the response, answering from the
+        cache when one is configured.
+        """
+        key = entry = None
+        if self.cache is not None and self.cache.caches(resource):
+            key = self.cache.key(url, kwargs.get('params'), variant)
+            entry = self.cache.get(key)
+            if entry is not None and entry.fresh:
+                return entry.data
+            kwargs['headers'] = entry.validators() if entry else {}
+        request, event = self._send('get', url, **kwargs)
+        self._request = request
+        if entry is not None and request.status_code == 304:
+            # Nothing has changed, so skip parsing altogether.
+            entry.refresh(self.cache.ttl_for(resource))
+            self._report(event, 0.0)
+            return entry.data
+        started = time.time()
+        data = parse(request)
+        self._report(event, time.time() - started)
+        if key is not None and request.status_code == 200:
+            etag = request.headers.get('ETag')
+            modified = request.headers.get('Last-Modified')
+            ttl = self.cache.ttl_for(resource)
+            self.cache.set(key, Entry(data, ttl, etag, modified))
+        return data
+
+    def _send(self, method, url, **kwargs):
+        """
+        Send a request once the rate limiter allows it, or answer it from
+        a replaying cassette. With hooks, the body is read right away, so
+        that waiting for the first byte and downloading the rest can be
+        timed separately, and a timing event is returned along with the
+        response.
+        """
+        cassette = self.cassette
+        if cassette is not None and cassette.replaying:
+            send = lambda url, **kwargs: cassette.play(method, url, **kwargs)
+        else:
+            self._throttle()
+            send = getattr(self.session, method)
+        event = None
+        if not self.hooks:
+            response = send(url, **kwargs)
+        else:
+            started = time.time()
+            response = send(url, stream=True, **kwargs)
+            ttfb = time.time() - started
+            content = response.content
+            event = {'method': method.upper(), 'url': url,
+                     'endpoint': self.endpoint, 'city': self.city,
+                     'status': response.status_code, 'bytes': len(content),
+                     'ttfb': ttfb, 'download': time.time() - started - ttfb}
+        if cassette is not None and not cassette.replaying:
+            cassette.record(method, url, kwargs, response)
+        return response, event
+
+    def _report(self, event, parse):
+        """Pass a timing event, with its parse time, to every hook."""
+        if event is None:
+            return
+        event['parse'] = parse
+        for hook in self.hooks:
+            hook(event)
+
     def discovery(self, url=None):
         """
         Retrieve the standard discovery file that provides routing
@@ -178,19 +478,22 @@ class Three(object):
         {'discovery': 'data'}
         """
         if url:
-            data = self.session.get(url).content
+            data = self._fetch('discovery', url, lambda r: r.content, 'raw')
         elif self.discovery_url:
-            response = self.session.get(self.discovery_url)
-            if self.format == 'xml':
-                # Because, SF doesn't follow the spec.
-                data = xml(response.text)
-            else:
-                # Spec calls for discovery always allowing JSON.
-                data = response.json()
+            data = self._fetch('discovery', self.discovery_url,
+                               self._parse_discovery, 'discovery')
         else:
             data = self.get('discovery')
         return data
 
+    def _parse_discovery(self, response):
+        """Parse the response from a city's discovery URL."""
+        if self.format == 'xml':
+            # Because, SF doesn't follow the spec.
+            return xml(response.text)
+        # Spec calls for discovery always allowing JSON.
+        return response.json()
+
     def services(self, code=None, **kwargs):
         """
         Retrieve information about available services. You can also enter a
@@ -217,8 +520,345 @@ class Three(object):
         if code:
             kwargs['service_code'] = code
         data = self.get('requests', **kwargs)
+        if self.records and kwargs.get('convert', True):
+            data = self._service_requests(data)
         return data
 
+    def iter_requests(self, code=None, workers=1, **kwargs):
+        """
+        Iterate over every service request, one at a time, by walking
+        through the `page` parameter. The next page is fetched in the
+        background while the current one is being consumed, and iteration
+        stops at the first empty or short page. Use `workers` to keep more
+        pages in flight at once.
+
+        >>> t = Three('api.city.gov')
+        >>> for request in t.iter_requests(status='open', count=100):
+        ...     print(request['service_request_id'])
+        """
+        kwargs = self._page_keywords(code, **kwargs)
+        page = int(kwargs.pop('page', 1))
+        for records in self._iter_pages(kwargs, page, None, workers):
+            for record in records:
+                yield record
+
+    def snapshot(self, code=None, at=None, workers=1, **kwargs):
+        """
+        Iterate over every service request as of a moment (`at`, or now),
+        like `iter_requests`, but without the duplicates and gaps caused by
+        requests shifting between pages mid-way. The end of the date range
+        is pinned and each ID is only yielded once. The first and last
+        requested times of every page are recorded: when a page shows signs
+        of drift (an ID seen already, or a record out of order), earlier
+        pages are fetched again, back to the first one whose bounds didn't
+        move. Records dropping out of the query shift pages the other way
+        without leaving either sign, so when the gap between two pages is
+        wider than any between neighbouring records on either of them, the
+        dates in that gap are queried as well.
+
+        >>> for request in Three('api.city.gov').snapshot(status='open'):
+        ...     print(request['service_request_id'])
+        """
+        kwargs = self._page_keywords(code, **kwargs)
+        if not set(kwargs) & set(['end', 'end_date', 'between']):
+            kwargs['end'] = at or datetime.utcnow().replace(microsecond=0)
+        first = page = int(kwargs.pop('page', 1))
+        seen = set()
+        bounds = {}
+        spacing = {}
+
+        def unseen(records):
+            for record in records:
+                id = _id(record)
+                if id is None:
+                    yield record
+                elif id not in seen:
+                    seen.add(id)
+                    yield record
+
+        newest_first = None
+        for records in self._iter_pages(kwargs, page, None, workers):
+            drift = any(_id(record) in seen for record in records)
+            times = _times(records)
+            if newest_first is None and len(set(times)) > 1:
+                newest_first = times[0] > times[-1]
+            previous = bounds.get(page - 1)
+            if previous and times and newest_first is not None:
+                # The order should carry on across the page boundary.
+                drift = drift or (times[0] > previous[1] if newest_first
+                                  else times[0] < previous[1])
+            bounds[page] = (times[0], times[-1]) if times else None
+            if drift:
+                for record in self._walk_back(page, first, bounds, kwargs,
+                                              unseen):
+                    yield record
+            for record in unseen(records):
+                yield record
+            spacing[page] = _spacing(times)
+            if previous and times and abs(times[0] - previous[1]) > \
+                    max(spacing[page - 1], spacing[page]):
+                # Whatever fell between the pages moved onto the last one
+                # after it was fetched.
+                for record in unseen(self._seam(previous[1], times[0],
+                                                kwargs)):
+                    yield record
+            page += 1
+
+    def _walk_back(self, page, first, bounds, kwargs, unseen):
+        """
+        Fetch the pages before `page` again, from the nearest one back,
+        until one still starts and ends where it did.
+        """
+        for earlier in range(page - 1, first - 1, -1):
+            records = self._page(earlier, kwargs)
+            for record in unseen(records):
+                yield record
+            times = _times(records)
+            moved = (times[0], times[-1]) if times else None
+            if moved == bounds[earlier]:
+                break
+            bounds[earlier] = moved
+
+    def _seam(self, last, following, kwargs):
+        """Every record requested between the ends of two pages."""
+        window = dict((key, value) for key, value in kwargs.items()
+                      if key not in ('start', 'end', 'between',
+                                     'start_date', 'end_date'))
+        window['between'] = (min(last, following), max(last, following))
+        for records in self._iter_pages(window, 1, None, 1):
+            for record in records:
+                yield record
+
+    def batches(self, code=None, size=10000, **kwargs):
+        """
+        Iterate over every service request in columnar, NumPy-backed
+        batches of up to `size` rows. Keyword arguments are the same as
+        for `iter_requests`.
+
+        >>> for batch in Three('api.city.gov').batches(size=5000):
+        ...     print(batch['status'].counts())
+        """
+        return batches(self.iter_requests(code, **kwargs), size)
+
+    def pages(self, code=None, first=1, last=None, workers=None, **kwargs):
+        """
+        Retrieve pages `first` through `last` of requests concurrently and
+        merge them in page order. Without a `last` page, pages are fetched
+        until the first empty or short one.
+
+        >>> Three('api.city.gov').pages(first=1, last=10, workers=5)
+        [{'requests': 'data'}]
+        """
+        kwargs = self._page_keywords(code, **kwargs)
+        workers = workers or self.workers
+        data = []
+        for records in self._iter_pages(kwargs, first, last, workers):
+            data.extend(records)
+        return data
+
+    def _page_keywords(self, code=None, **kwargs):
+        """Format keywords shared by every page of a paginated query."""
+        if code:
+            kwargs['service_code'] = code
+        if 'count' in kwargs:
+            kwargs['page_size'] = kwargs.pop('count')
+        return kwargs
+
+    def _iter_pages(self, kwargs, page, last, workers):
+        """
+        Yield pages of records in order, keeping up to `workers` pages in
+        flight, and stop at the first page short of a full one. A full page
+        is the `page_size` asked for, unless the `cap` setting says the
+        server sends fewer. Without either, only the first page is
+        requested until its size is known.
+        """
+        size = int(_page_size(kwargs) or 0) or None
+        if self.cap:
+            size = min(size or self.cap, self.cap)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = deque([executor.submit(self._page, page, kwargs)])
+        try:
+            first = None
+            while pending:
+                records = pending.popleft().result()
+                if not records or records[0] == first:
+                    # Some servers ignore `page` and keep sending the same
+                    # results back, so a repeated page also ends things.
+                    break
+                if not size:
+                    size = len(records)
+                full = len(records) >= size
+                while full and len(pending) < workers and \
+                        (last is None or page < last):
+                    page += 1
+                    pending.append(executor.submit(self._page, page, kwargs))
+                yield records
+                if not full:
+                    break
+                first = records[0]
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _page(self, page, kwargs):
+        """Retrieve a single page of requests as a list of records."""
+        params = dict(kwargs, page=page)
+        return self._service_requests(self.get('requests', **params))
+
+    def backfill(self, between, code=None, cap=None, workers=None,
+                 **kwargs):
+        """
+        Retrieve every request between two dates, even from servers that
+        silently cap how many results a query returns. Any window that
+        comes back with `cap` or more results is split in half and both
+        halves are fetched concurrently, until no window is capped. Without
+        a `cap` (here or in the city's settings), the `page_size` asked for
+        is used; without either, the range is fetched in one request.
+
+        >>> Three('api.city.gov').backfill(['01-01-2012', '12-31-2012'])
+        [{'requests': 'data'}]
+        """
+        if code:
+            kwargs['service_code'] = code
+        start, end = [self._parse_datetime(time) for time in between]
+
+        def fetch(window):
+            data = self.get('requests', between=window, **kwargs)
+            return self._service_requests(data)
+
+        def split(window):
+            first, last = window
+            if last - first < timedelta(seconds=2):
+                # Dates are only sent to the second, so stop there.
+                return None
+            middle = first + (last - first) // 2
+            middle = middle.replace(microsecond=0)
+            return [(first, middle), (middle, last)]
+
+        windows = self._refine([(start, end)], fetch, split,
+                               workers or self.workers,
+                               self._cap(cap, kwargs))
+        windows.sort(key=lambda window: window[0])
+        return list(self._unique(record for window, records in windows
+                                 for record in records))
+
+    def requests_in_bbox(self, bbox, code=None, cap=None, tile=None,
+                         workers=None, **kwargs):
+        """
+        Retrieve every request inside a `(south, west, north, east)`
+        bounding box, using the `lat`, `long` and `radius` filters. The
+        box is covered with tiles no more than `tile` degrees across
+        (one tile by default), each fetched as the smallest circle around
+        it. Tiles that come back with `cap` or more results are split
+        into quarters and fetched again, concurrently, until none are
+        full. Without a `cap` (here or in the city's settings), the
+        `page_size` asked for is used; without either, each tile is only
+        fetched once.
+
+        >>> Three('api.city.gov').requests_in_bbox(
+        ...     (32.80, -83.70, 32.90, -83.60), cap=500)
+        [{'requests': 'data'}]
+        """
+        if code:
+            kwargs['service_code'] = code
+        south, west, north, east = [float(edge) for edge in bbox]
+
+        def fetch(box):
+            first, left, last, right = box
+            radius = distance((first, left), (last, right)) / 2
+            data = self.get('requests', lat=round((first + last) / 2, 6),
+                            long=round((left + right) / 2, 6),
+                            radius=int(math.ceil(radius)) + 1, **kwargs)
+            return self._service_requests(data)
+
+        rows = columns = 1
+        if tile:
+            rows = max(1, int(math.ceil((north - south) / float(tile))))
+            columns = max(1, int(math.ceil((east - west) / float(tile))))
+        height = (north - south) / rows
+        width = (east - west) / columns
+        boxes = [(south + row * height, west + column * width,
+                  south + (row + 1) * height, west + (column + 1) * width)
+                 for row in range(rows) for column in range(columns)]
+
+        def split(box):
+            first, left, last, right = box
+            if distance((first, left), (last, right)) < 2:
+                return None
+            middle = (first + last) / 2
+            center = (left + right) / 2
+            return [(first, left, middle, center),
+                    (first, center, middle, right),
+                    (middle, left, last, center),
+                    (middle, center, last, right)]
+
+        tiles = self._refine(boxes, fetch, split, workers or self.workers,
+                             self._cap(cap, kwargs))
+        tiles.sort(key=lambda item: item[0])
+        # Circles reach past their tiles, and the box.
+        return list(self._unique(
+            record for box, records in tiles for record in records
+            if _inside(record, south, west, north, east)))
+
+    def _refine(self, items, fetch, split, workers, cap=None):
+        """
+        Fetch items concurrently. Any item that comes back with `cap` or
+        more records is broken into smaller pieces by `split` (which
+        returns nothing once an item can't get any smaller), and those
+        pieces are fetched in the next round. Pieces aren't split again
+        once, between them, they find no more records than the item they
+        came from. Without a `cap`, a full result can't be told from a
+        complete one, so every item is only fetched once. Returns the
+        `(item, records)` pairs that didn't need splitting.
+        """
+        done = []
+        # How many records each split item found, and which of them each
+        # piece in the round came from.
+        found = []
+        pending = [(item, None) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while pending:
+                results = list(executor.map(
+                    fetch, [item for item, parent in pending]))
+                families = defaultdict(set)
+                for (item, parent), records in zip(pending, results):
+                    if parent is not None:
+                        families[parent].update(_ids(records))
+                pieces = []
+                for (item, parent), records in zip(pending, results):
+                    split_items = None
+                    if cap and len(records) >= cap and (
+                            parent is None or
+                            len(families[parent]) > found[parent]):
+                        split_items = split(item)
+                    if split_items:
+                        found.append(len(_ids(records)))
+                        pieces.extend((piece, len(found) - 1)
+                                      for piece in split_items)
+                    else:
+                        done.append((item, records))
+                pending = pieces
+        return done
+
+    def _cap(self, cap, kwargs):
+        """
+        The most results a query can return: the `cap` given, the city's,
+        or else the `page_size` asked for.
+        """
+        return int(cap or self.cap or _page_size(kwargs) or 0) or None
+
+    def _unique(self, records):
+        """Drop records whose `service_request_id` was already seen."""
+        seen = set()
+        for record in records:
+            id = record.get('service_request_id')
+            if id is not None:
+                if id in seen:
+                    continue
+                seen.add(id)
+            yield record
+
     def request(self, id, **kwargs):
         """
         Retrieve a specific request using its service code ID.
@@ -227,49 +867,104 @@ class Three(object):
         {'request': {'service_code': {'12345': 'data'}}}
         """
         data = self.get('requests', id, **kwargs)
+        if self.records and kwargs.get('convert', True):
+            data = self._service_requests(data)
         return data
 
+    def request_many(self, ids, size=100, length=1500, workers=None,
+                     **kwargs):
+        """
+        Retrieve many requests by their IDs. The IDs are sent as comma
+        separated `service_request_id` lists of at most `size` IDs and
+        `length` (URL encoded) characters, and those batches are sent
+        concurrently. Returns a dict keyed by ID, where IDs the city
+        didn't send back map to `None`.
+
+        >>> Three('api.city.gov').request_many(['123', '456'])
+        {'123': {'request': 'data'}, '456': None}
+        """
+        results = {}
+        for id in ids:
+            results.setdefault(str(id), None)
+
+        def fetch(batch):
+            data = self.get('requests', service_request_id=','.join(batch),
+                            **kwargs)
+            return self._service_requests(data)
+
+        batches = self._id_batches(list(results), size, length)
+        with ThreadPoolExecutor(max_workers=workers or self.workers) as pool:
+            for records in pool.map(fetch, batches):
+                for record in records:
+                    id = str(record.get('service_request_id'))
+                    if id in results:
+                        results[id] = record
+        return results
+
+    def _id_batches(self, ids, size, length):
+        """Split IDs into batches that keep URLs a reasonable length."""
+        batches, batch, used = [], [], 0
+        for id in ids:
+            # Commas are sent as `%2C`.
+            needed = len(id) + (3 if batch else 0)
+            if batch and (len(batch) >= size or used + needed > length):
+                batches.append(batch)
+                batch, used = [], 0
+                needed = len(id)
+            batch.append(id)
+            used += needed
+        if batch:
+            batches.append(batch)
+        return batches
+
     def post(self, service_code='0', **kwargs):
         """
         Post a new Open311 request.
 
+        A `media` file given as a path or a seekable binary file is streamed
+        from disk as it's uploaded; anything else `requests` takes as a
+        file, like bytes or a `(filename, data, content_type)` tuple, is
+        sent as is.
+
         >>> t = Three('api.city.gov')
         >>> t.post('123', address='123 Any St', name='Zach Williams',
         ...        phone='555-5555', description='My issue description.',
-        ...        media=open('photo.png', 'rb'))
+        ...        media='photo.png')
         {'successful': {'request': 'post'}}
         """
         kwargs['service_code'] = service_code
         kwargs = self._post_keywords(**kwargs)
         media = kwargs.pop('media', None)
-        if media:
-            files = {'media': media}
-        else:
-            files = None
         url = self._create_path('requests')
-        self.post_response = self.session.post(url,
-                                               data=kwargs, files=files)
+        if media and streamable(media):
+            body = MultipartStream(kwargs, {'media': media})
+            headers = {'Content-Type': body.content_type}
+            options = {'data': body, 'headers': headers}
+        elif media:
+            options = {'data': kwargs, 'files': {'media': media}}
+        else:
+            options = {'data': kwargs, 'files': None}
+        self.post_response, event = self._send('post', url, **options)
         content = self.post_response.content
         if self.post_response.status_code >= 500:
             conversion = False
         else:
             conversion = True
-        return self.convert(content, conversion)
+        started = time.time()
+        data = self.convert(content, conversion)
+        self._report(event, time.time() - started)
+        return data
 
-    def _post_keywords(self, **kwargs):
-        """Configure keyword arguments for Open311 POST requests."""
-        if self.jurisdiction and 'jurisdiction_id' not in kwargs:
-            kwargs['jurisdiction_id'] = self.jurisdiction
-        if 'address' in kwargs:
-            address = kwargs.pop('address')
-            kwargs['address_string'] = address
-        if 'name' in kwargs:
-            first, last = kwargs.pop('name').split(' ')
-            kwargs['first_name'] = first
-            kwargs['last_name'] = last
-        if 'api_key' not in kwargs:
-            kwargs['api_key'] = self.api_key
-        return kwargs
+    def submit(self, reports, workers=4, ledger=None):
+        """
+        Post many reports concurrently, yielding a result for each one in
+        order. Reports already recorded in the `ledger` aren't sent again.
+
+        >>> t = Three('api.city.gov', api_key='SECRET_KEY')
+        >>> for result in t.submit(reports, ledger='submitted.json'):
+        ...     print(result['key'], result['status'])
+        """
+        return submit(self, reports, workers, ledger)
 
     def token(self, id, **kwargs):
         """
@@ -280,3 +975,43 @@ class Three(object):
         """
         data = self.get('tokens', id, **kwargs)
         return data
+
+
+def _inside(record, south, west, north, east):
+    """Whether a record is inside a box, if it has a location at all."""
+    point = location(record)
+    if point is None:
+        return True
+    lat, long = point
+    return south <= lat <= north and west <= long <= east
+
+
+def _times(records):
+    """The requested times of the records that have one, in order."""
+    times = [utc_datetime(record.get('requested_datetime'))
+             for record in records]
+    return [time for time in times if time is not None]
+
+
+def _spacing(times):
+    """The widest gap between neighbouring times."""
+    gaps = [abs(later - earlier) for earlier, later in zip(times, times[1:])]
+    return max(gaps or [timedelta(0)])
+
+
+def _id(record):
+    """A record's `service_request_id` as a string, to compare IDs."""
+    id = record.get('service_request_id')
+    if id is None or id == {}:
+        return None
+    return str(id)
+
+
+def _ids(records):
+    """The distinct IDs among some records."""
+    return set(id for id in map(_id, records) if id is not None)
+
+
+def _page_size(kwargs):
+    """The page size asked for in request keywords, if any."""
+    return kwargs.get('page_size') or kwargs.get('count')
@@ -0,0 +1,32 @@
+"""
+Locations and distances, for records with a `lat` and `long`.
+
+>>> from three.geo import distance
+>>> distance((32.84, -83.63), (32.84, -83.62))
+934.2...
+"""
+
+import math
+
+
+# Roughly how many meters there are in a degree of latitude.
+METERS = 111320.0
+
+EARTH_RADIUS = 6371008.8
+
+
+def location(record):
+    """A record's `(lat, long)`, or None if it doesn't have one."""
+    try:
+        return float(record.get('lat')), float(record.get('long'))
+    except (TypeError, ValueError):
+        return None
+
+
+def distance(first, second):
+    """The great-circle distance between two points, in meters."""
+    lat1, long1 = [math.radians(degrees) for degrees in first]
+    lat2, long2 = [math.radians(degrees) for degrees in second]
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * \
+        math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(1.0, a)))
@@ -0,0 +1,234 @@
+"""
+An in-memory index for fast, repeated queries over fetched requests.
+
+>>> from three import Three, RequestIndex
+>>> index = RequestIndex(Three('api.city.gov').requests())
+>>> index.query(bbox=(32.80, -83.65, 32.85, -83.60), status='open',
+...             start='2013-01-01', end='2013-01-31')
+[{'service_request_id': '12345', ...}]
+"""
+
+import math
+from bisect import bisect_left, bisect_right, insort
+
+from .geo import METERS, distance, location
+from .records import query_bound, utc_datetime
+
+
+class RequestIndex(object):
+    """
+    Requests indexed by location, on a grid of `cell` degree squares, by
+    the values of the categorical `fields`, and in `requested_datetime`
+    order. Records can be dicts or `ServiceRequest` instances; adding one
+    with a `service_request_id` that's already indexed replaces it.
+    """
+
+    def __init__(self, records=None, cell=0.01,
+                 fields=('service_code', 'status')):
+        self.cell = float(cell)
+        self.fields = tuple(fields)
+        self._records = []
+        self._points = []
+        self._ids = {}
+        self._grid = {}
+        self._hashes = dict((field, {}) for field in self.fields)
+        self._dates = []
+        self._times = []
+        self._count = 0
+        if records:
+            self.add(records)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (record for record in self._records if record is not None)
+
+    def add(self, records):
+        """Index more records, like the results of `requests()`."""
+        for record in _unwrap(records):
+            id = record.get('service_request_id')
+            if id is not None and id != {}:
+                id = str(id)
+                if id in self._ids:
+                    self._remove(self._ids[id])
+                self._ids[id] = len(self._records)
+            self._insert(record)
+
+    def _insert(self, record):
+        position = len(self._records)
+        self._records.append(record)
+        self._count += 1
+        point = location(record)
+        self._points.append(point)
+        if point is not None:
+            self._grid.setdefault(self._cell(*point), set()).add(position)
+        for field, values in self._hashes.items():
+            values.setdefault(_value(record.get(field)), set()).add(position)
+        requested = utc_datetime(record.get('requested_datetime'))
+        self._times.append(requested)
+        if requested is not None:
+            insort(self._dates, (requested, position))
+
+    def _remove(self, position):
+        record = self._records[position]
+        self._records[position] = None
+        self._count -= 1
+        point = self._points[position]
+        if point is not None:
+            self._grid[self._cell(*point)].discard(position)
+        for field, values in self._hashes.items():
+            values[_value(record.get(field))].discard(position)
+        requested = self._times[position]
+        if requested is not None:
+            index = bisect_left(self._dates, (requested, position))
+            del self._dates[index]
+
+    def _cell(self, lat, long):
+        return (int(math.floor(lat / self.cell)),
+                int(math.floor(long / self.cell)))
+
+    def query(self, bbox=None, near=None, radius=None, start=None, end=None,
+              **fields):
+        """
+        Find the records matching every filter given, in the order they
+        were added:
+
+        * `bbox`, a `(south, west, north, east)` box in degrees;
+        * `near`, a `(lat, long)` point, with a `radius` in meters;
+        * `start` and `end`, an inclusive range of requested datetimes,
+          given as datetimes, dates or date strings;
+        * any field, like `service_code` or `status`, matching a value or
+          any of a list of values.
+
+        Only the most selective index is used to find candidates; the
+        other filters are checked against each of them.
+        """
+        # Each filter is a (size, candidates, check) triple. Candidates
+        # are only gathered for the smallest; the others are intersected
+        # with it when they're already a set, or checked one by one.
+        # Filters without an index have no candidates, only a check.
+        filters = []
+        if bbox is not None:
+            box = self._box(*bbox)
+            filters.append((len(box), box, box.__contains__))
+        if near is not None:
+            circle = self._near(near, radius)
+            filters.append((len(circle), circle, circle.__contains__))
+        if start is not None or end is not None:
+            filters.append(self._between(start, end))
+        for field, wanted in fields.items():
+            if not isinstance(wanted, (list, tuple, set, frozenset)):
+                wanted = [wanted]
+            wanted = frozenset(_value(value) for value in wanted)
+            filters.append(self._matching(field, wanted))
+        checks = [check for _, candidates, check in filters
+                  if candidates is None]
+        filters = sorted((item for item in filters if item[1] is not None),
+                         key=lambda item: item[0])
+        if filters:
+            candidates = filters[0][1]
+            positions = set(candidates() if callable(candidates)
+                            else candidates)
+        else:
+            positions = range(len(self._records))
+        for _, candidates, check in filters[1:]:
+            if isinstance(candidates, set):
+                positions = positions.intersection(candidates)
+            else:
+                checks.append(check)
+        records = self._records
+        return [records[position] for position in sorted(positions)
+                if records[position] is not None and
+                all(check(position) for check in checks)]
+
+    def _matching(self, field, wanted):
+        """A filter for records with one of the `wanted` field values."""
+        records = self._records
+        check = lambda position: _value(records[position].get(field)) in \
+            wanted
+        if field not in self._hashes:
+            # Without an index, every record has to be checked.
+            return (len(records), None, check)
+        groups = [self._hashes[field].get(value, set()) for value in wanted]
+        if len(groups) == 1:
+            return (len(groups[0]), groups[0], check)
+        return (sum(len(group) for group in groups),
+                lambda: set().union(*groups), check)
+
+    def count(self, **filters):
+        """Count the records matching `query` filters."""
+        return len(self.query(**filters))
+
+    def _box(self, south, west, north, east):
+        """Positions of the records inside a bounding box."""
+        first = self._cell(south, west)
+        last = self._cell(north, east)
+        cells = (last[0] - first[0] + 1) * (last[1] - first[1] + 1)
+        if cells > len(self._grid):
+            # A huge box over sparse data: check the occupied cells.
+            keys = [key for key in self._grid
+                    if first[0] <= key[0] <= last[0] and
+                    first[1] <= key[1] <= last[1]]
+        else:
+            keys = [(row, column)
+                    for row in range(first[0], last[0] + 1)
+                    for column in range(first[1], last[1] + 1)]
+        positions = set()
+        for key in keys:
+            if first[0] < key[0] < last[0] and first[1] < key[1] < last[1]:
+                # Cells inside the box don't need checking point by point.
+                positions.update(self._grid.get(key, ()))
+                continue
+            for position in self._grid.get(key, ()):
+                lat, long = self._points[position]
+                if south <= lat <= north and west <= long <= east:
+                    positions.add(position)
+        return positions
+
+    def _near(self, point, radius):
+        """Positions of the records within `radius` meters of a point."""
+        lat, long = point
+        radius = float(radius or 0)
+        spread = radius / METERS
+        scale = max(math.cos(math.radians(lat)), 1e-6)
+        box = self._box(lat - spread, long - spread / scale,
+                        lat + spread, long + spread / scale)
+        return set(position for position in box
+                   if distance(point, self._points[position]) <= radius)
+
+    def _between(self, start, end):
+        """A filter for records requested within a range."""
+        first = query_bound(start) if start is not None else None
+        last = query_bound(end, True) if end is not None else None
+        low = bisect_left(self._dates, (first,)) if first else 0
+        high = bisect_right(self._dates, (last, float('inf'))) \
+            if last else len(self._dates)
+        times = self._times
+
+        def check(position):
+            time = times[position]
+            return time is not None and (first is None or time >= first) \
+                and (last is None or time <= last)
+
+        return (high - low,
+                lambda: [position for _, position in self._dates[low:high]],
+                check)
+
+
+def _unwrap(records):
+    """Accept results as a list, a single record, or keyed XML content."""
+    if not records:
+        return []
+    if isinstance(records, dict):
+        if 'service_request_id' not in records and len(records) == 1:
+            return _unwrap(list(records.values())[0])
+        return [records]
+    return records
+
+
+def _value(value):
+    """Normalize categorical values, so `5` and `'5'` are the same."""
+    if value is None or value == {}:
+        return None
+    return str(value)
@@ -0,0 +1,129 @@
+"""
+Timing hooks and built-in aggregation of per-call metrics.
+
+>>> from three import Three, Metrics
+>>> metrics = Metrics()
+>>> t = Three('api.city.gov', hooks=[metrics])
+>>> t.requests()
+>>> print(metrics.prometheus())
+"""
+
+import threading
+from collections import defaultdict
+
+
+# Latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The timed phases of each call.
+PHASES = ('ttfb', 'download', 'parse')
+
+
+class Histogram(object):
+    """Counts of observations falling into fixed buckets."""
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        """Bucket counts including every smaller bucket, like Prometheus."""
+        total, counts = 0, []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Metrics(object):
+    """
+    A hook that aggregates call events into counters and latency
+    histograms, labeled by city, method and status code. Pass it in a
+    client's `hooks` and export it with `as_dict` or `prometheus`.
+
+    Each event is a dict with the `method`, `url`, `endpoint`, `city` and
+    `status` of the call, the `bytes` received, and the `ttfb`,
+    `download` and `parse` times in seconds. Connection setup isn't
+    exposed by `requests`, so it's counted as part of `ttfb`.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.requests = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.latency = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        labels = (event.get('city') or event.get('endpoint') or '',
+                  event['method'], str(event.get('status')))
+        with self._lock:
+            self.requests[labels] += 1
+            self.bytes[labels] += event.get('bytes') or 0
+            for phase in PHASES:
+                if event.get(phase) is None:
+                    continue
+                key = (phase,) + labels[:2]
+                if key not in self.latency:
+                    self.latency[key] = Histogram(self.buckets)
+                self.latency[key].observe(event[phase])
+
+    def as_dict(self):
+        """Export every counter and histogram as plain data."""
+        with self._lock:
+            requests = [dict(zip(('city', 'method', 'status'), labels),
+                             count=count, bytes=self.bytes[labels])
+                        for labels, count in sorted(self.requests.items())]
+            latency = [dict(zip(('phase', 'city', 'method'), key),
+                            count=histogram.count, sum=histogram.sum,
+                            buckets=dict(zip(self.buckets,
+                                             histogram.cumulative())))
+                       for key, histogram in sorted(self.latency.items())]
+        return {'requests': requests, 'latency': latency}
+
+    def prometheus(self):
+        """Export everything in the Prometheus text format."""
+        data = self.as_dict()
+        lines = ['# TYPE three_requests_total counter']
+        for row in data['requests']:
+            lines.append('three_requests_total%s %d' % (
+                _labels(row, 'city', 'method', 'status'), row['count']))
+        lines.append('# TYPE three_response_bytes_total counter')
+        for row in data['requests']:
+            lines.append('three_response_bytes_total%s %d' % (
+                _labels(row, 'city', 'method', 'status'), row['bytes']))
+        lines.append('# TYPE three_seconds histogram')
+        for row in data['latency']:
+            for bound in self.buckets:
+                labels = _labels(row, 'phase', 'city', 'method',
+                                 le=repr(bound))
+                lines.append('three_seconds_bucket%s %d' % (
+                    labels, row['buckets'][bound]))
+            labels = _labels(row, 'phase', 'city', 'method', le='+Inf')
+            lines.append('three_seconds_bucket%s %d' % (labels,
+                                                        row['count']))
+            labels = _labels(row, 'phase', 'city', 'method')
+            lines.append('three_seconds_sum%s %r' % (labels, row['sum']))
+            lines.append('three_seconds_count%s %d' % (labels,
+                                                       row['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(row, *names, **extra):
+    """Format Prometheus labels."""
+    pairs = [(name, row[name]) for name in names] + sorted(extra.items())
+    escaped = ['%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                            .replace('"', '\\"'))
+               for name, value in pairs]
+    return '{%s}' % ','.join(escaped)
@@ -0,0 +1,75 @@
+"""
+Client-side rate limiting, shared by every client talking to a host.
+
+>>> from three import Three
+>>> t = Three('seeclickfix.com/macon/open311/', rate_limit=2, burst=5)
+"""
+
+import threading
+import time
+import warnings
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2
+    monotonic = time.time
+
+
+class TokenBucket(object):
+    """
+    A thread-safe token bucket that refills at `rate` tokens a second and
+    holds at most `burst` of them. Callers are never turned away: each
+    one reserves a token up front and waits its turn, so calls are queued
+    in the order they arrive.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        Take tokens from the bucket, returning the number of seconds to
+        wait before using them. Async code can sleep on this itself.
+        """
+        with self._lock:
+            now = monotonic()
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until the tokens can be used."""
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def limiter(key, rate, burst=None):
+    """
+    Find the shared bucket for a key (like a hostname), creating it with
+    the given rate and burst the first time it's asked for. Asking again
+    with a different rate or burst warns, since the first one still wins.
+    """
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(rate, burst)
+        bucket = _buckets[key]
+    wanted = TokenBucket(rate, burst)
+    if (wanted.rate, wanted.burst) != (bucket.rate, bucket.burst):
+        warnings.warn("%s is already limited to %g requests a second with "
+                      "a burst of %g" % (key, bucket.rate, bucket.burst),
+                      RuntimeWarning, stacklevel=2)
+    return bucket
@@ -0,0 +1,208 @@
+"""
+A compact record type for Open311 service requests.
+
+>>> from three import Three
+>>> t = Three('api.city.gov', records=True)
+>>> t.request('12345')
+[<ServiceRequest 12345: open>]
+"""
+
+import re
+from datetime import date, datetime, timedelta
+
+try:
+    from datetime import timezone
+except ImportError:
+    # Python 2
+    from datetime import tzinfo
+
+    class timezone(tzinfo):
+        """A fixed offset from UTC."""
+        def __init__(self, offset):
+            self.offset = offset
+
+        def utcoffset(self, dt):
+            return self.offset
+
+        def dst(self, dt):
+            return timedelta(0)
+
+try:
+    # Python 3
+    from sys import intern
+except ImportError:
+    # Python 2
+    pass
+
+
+STRINGS = ('service_request_id', 'service_code', 'service_name', 'status',
+           'status_notes', 'description', 'agency_responsible',
+           'service_notice', 'address', 'address_id', 'zipcode', 'media_url')
+# Fields that repeat across many requests, so their strings are shared.
+INTERNED = ('service_code', 'service_name', 'status', 'agency_responsible')
+DATETIMES = ('requested_datetime', 'updated_datetime', 'expected_datetime')
+FLOATS = ('lat', 'long')
+FIELDS = STRINGS + DATETIMES + FLOATS
+
+iso8601 = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})"
+                     r"(?::(\d{2})(?:\.(\d{1,6})\d*)?)?)?"
+                     r"\s*(Z|[+-]\d{2}:?\d{2})?$")
+
+_timezones = {}
+
+
+def parse_datetime(value):
+    """
+    Parse an ISO 8601 timestamp, like those Open311 servers send, into a
+    datetime. Timestamps with an offset become timezone aware.
+
+    >>> parse_datetime('2010-04-14T06:37:38-08:00')
+    datetime.datetime(2010, 4, 14, 6, 37, 38, tzinfo=...)
+    """
+    if not value or isinstance(value, datetime):
+        return value or None
+    match = iso8601.match(value.strip())
+    if not match:
+        raise ValueError("Invalid datetime: %s" % value)
+    parts = match.groups()
+    fraction = (parts[6] or '0').ljust(6, '0')
+    numbers = [int(part or 0) for part in parts[:6]] + [int(fraction)]
+    return datetime(*numbers, tzinfo=_timezone(parts[7]))
+
+
+def utc_datetime(value):
+    """
+    Parse a timestamp into a naive UTC datetime, for comparing times from
+    any timezone, or None if it isn't one.
+
+    >>> utc_datetime('2010-04-14T06:37:38-08:00')
+    datetime.datetime(2010, 4, 14, 14, 37, 38)
+    """
+    try:
+        value = parse_datetime(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+    if not isinstance(value, datetime):
+        return None
+    if value.utcoffset() is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return value
+
+
+def query_bound(value, end=False):
+    """
+    Turn a query bound into a naive UTC datetime. Dates, and date strings
+    like `03-31-2012` or `2012-03-31`, cover the whole day, so an `end`
+    bound falls on its last moment.
+
+    >>> query_bound('03-31-2012', end=True)
+    datetime.datetime(2012, 3, 31, 23, 59, 59, 999999)
+    """
+    if isinstance(value, str) and not re.match(r'\d{4}-', value):
+        month, day, year = [int(part) for part in re.split(r'-|/', value)]
+        value = date(year + 2000 if year < 100 else year, month, day)
+    elif isinstance(value, str) and len(value) == 10:
+        value = datetime.strptime(value, '%Y-%m-%d').date()
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+        if end:
+            value = value.replace(hour=23, minute=59, second=59,
+                                  microsecond=999999)
+        return value
+    return utc_datetime(value)
+
+
+def _timezone(offset):
+    """Find a shared timezone instance for an offset string."""
+    if not offset:
+        return None
+    if offset not in _timezones:
+        if offset == 'Z':
+            minutes = 0
+        else:
+            digits = offset[1:].replace(':', '')
+            minutes = int(digits[:2]) * 60 + int(digits[2:])
+            if offset[0] == '-':
+                minutes = -minutes
+        _timezones[offset] = timezone(timedelta(minutes=minutes))
+    return _timezones[offset]
+
+
+class ServiceRequest(object):
+    """
+    A single service request. The known GeoReport v2 fields are parsed
+    once into native types (strings, datetimes and floats) and kept in
+    slots, while any other fields go into the `extra` dict.
+    """
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, **fields):
+        for name in FIELDS:
+            setattr(self, name, None)
+        self.extra = None
+        for name, value in fields.items():
+            self[name] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a service request from converted content."""
+        return cls(**data)
+
+    def __setitem__(self, name, value):
+        if value == {} or value == '':
+            # Empty XML elements come through as empty dicts.
+            value = None
+        if name in STRINGS:
+            if value is not None:
+                value = str(value)
+                if name in INTERNED:
+                    value = intern(value)
+        elif name in DATETIMES:
+            value = parse_datetime(value)
+        elif name in FLOATS:
+            if value is not None:
+                value = float(value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[name] = value
+            return
+        setattr(self, name, value)
+
+    def __getitem__(self, name):
+        if name in FIELDS:
+            return getattr(self, name)
+        if self.extra and name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        """Find a field by name, like a dict."""
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """Turn the request back into a dict, leaving out empty fields."""
+        data = dict(self.extra or {})
+        for name in FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+    def __eq__(self, other):
+        if not isinstance(other, ServiceRequest):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return '<ServiceRequest %s: %s>' % (self.service_request_id,
+                                            self.status)
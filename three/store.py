@@ -0,0 +1,196 @@
+"""
+A local SQLite mirror of a city's service requests.
+
+>>> from three import Three, Store
+>>> store = Store('macon.db', Three('seeclickfix.com/macon/open311/'))
+>>> store.sync(since='01-01-2013')
+>>> store.requests('123', status='open')
+"""
+
+import sqlite3
+from datetime import datetime
+from itertools import islice
+
+import simplejson as json
+
+from .records import query_bound, utc_datetime
+
+
+CHECKPOINT = '%Y-%m-%dT%H:%M:%S'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    service_request_id TEXT PRIMARY KEY,
+    service_code TEXT,
+    status TEXT,
+    requested_datetime TEXT,
+    updated_datetime TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS requests_service_code ON requests (service_code);
+CREATE INDEX IF NOT EXISTS requests_status ON requests (status);
+CREATE INDEX IF NOT EXISTS requests_requested ON requests (requested_datetime);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+COLUMNS = ('service_request_id', 'service_code', 'status',
+           'requested_datetime', 'updated_datetime')
+
+
+class Store(object):
+    """
+    Keep service requests in a local SQLite database, keyed by their
+    `service_request_id`. Each `sync` only asks the city for requests
+    since the last checkpoint, and queries are answered locally.
+    """
+
+    def __init__(self, path, client, workers=1, batch=500):
+        self.client = client
+        self.workers = workers
+        self.batch = batch
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def checkpoint(self):
+        """Find when the last sync finished, if there's been one."""
+        row = self.connection.execute(
+            "SELECT value FROM checkpoints WHERE name = 'sync'").fetchone()
+        if row:
+            return datetime.strptime(row[0], CHECKPOINT)
+
+    def sync(self, since=None, until=None, refresh=True, **kwargs):
+        """
+        Fetch requests from the city since the last checkpoint (or since
+        `since`, when given) and upsert them. Any other keyword arguments
+        are passed along to the city. Returns the number of requests
+        stored.
+
+        The window is applied through `start_date` and `end_date`, which
+        most servers match against `requested_datetime`, so changes to
+        older requests never show up in it. With `refresh`, every stored
+        request that isn't closed is looked up again by ID as well.
+        """
+        since = since or self.checkpoint()
+        if until:
+            until = self.client._parse_datetime(until)
+        else:
+            until = datetime.utcnow().replace(microsecond=0)
+        if since:
+            kwargs['between'] = (self.client._parse_datetime(since), until)
+        records = self.client.iter_requests(workers=self.workers, **kwargs)
+        count = 0
+        fresh = set()
+        while True:
+            batch = list(islice(records, self.batch))
+            if not batch:
+                break
+            count += self.upsert(batch)
+            fresh.update(str(record.get('service_request_id'))
+                         for record in batch)
+        if refresh:
+            count += self._refresh(fresh)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES ('sync', ?)",
+                (until.strftime(CHECKPOINT),))
+        return count
+
+    def _refresh(self, fresh):
+        """Look up stored requests that are still open, by their IDs."""
+        cursor = self.connection.execute(
+            "SELECT service_request_id FROM requests "
+            "WHERE status IS NULL OR status != 'closed'")
+        ids = [row[0] for row in cursor if row[0] not in fresh]
+        if not ids:
+            return 0
+        results = self.client.request_many(ids, workers=self.workers)
+        return self.upsert([record for record in results.values()
+                            if record is not None])
+
+    def upsert(self, records):
+        """Insert or replace requests by their `service_request_id`."""
+        rows = []
+        for record in records:
+            if hasattr(record, 'to_dict'):
+                record = record.to_dict()
+            if not record.get('service_request_id'):
+                continue
+            values = [record.get(column) for column in COLUMNS]
+            values[0] = str(values[0])
+            for index in (3, 4):
+                # Times are kept in UTC, so they compare as text.
+                values[index] = self._timestamp(
+                    utc_datetime(values[index]) or values[index])
+            rows.append(values + [json.dumps(record, default=_isoformat)])
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+        return len(rows)
+
+    def request(self, id):
+        """Find a stored request by its `service_request_id`."""
+        row = self.connection.execute(
+            "SELECT data FROM requests WHERE service_request_id = ?",
+            (str(id),)).fetchone()
+        if row:
+            return json.loads(row[0])
+
+    def requests(self, code=None, status=None, start=None, end=None):
+        """
+        Find stored requests, optionally by service code, status or an
+        inclusive range of `requested_datetime` values. Dates, and date
+        strings like `12-31-2013`, cover the whole day, as they do for
+        `RequestIndex`.
+        """
+        query, params = self._where(code, status, start, end)
+        cursor = self.connection.execute(
+            "SELECT data FROM requests" + query +
+            " ORDER BY requested_datetime", params)
+        return [json.loads(row[0]) for row in cursor]
+
+    def count(self, code=None, status=None, start=None, end=None):
+        """Count stored requests, with the same filters as `requests`."""
+        query, params = self._where(code, status, start, end)
+        cursor = self.connection.execute(
+            "SELECT COUNT(*) FROM requests" + query, params)
+        return cursor.fetchone()[0]
+
+    def _where(self, code, status, start, end):
+        """Build a WHERE clause for the given filters."""
+        clauses, params = [], []
+        if code:
+            clauses.append('service_code = ?')
+            params.append(code)
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if start:
+            clauses.append('requested_datetime >= ?')
+            params.append(self._timestamp(query_bound(start)))
+        if end:
+            clauses.append('requested_datetime <= ?')
+            params.append(self._timestamp(query_bound(end, True)))
+        if not clauses:
+            return '', params
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def _timestamp(self, time):
+        """Turn a date or datetime into a comparable timestamp string."""
+        if hasattr(time, 'strftime'):
+            time = time.strftime(CHECKPOINT)
+        return time
+
+
+def _isoformat(value):
+    """Serialize the datetimes found in `ServiceRequest` records."""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(repr(value))
@@ -0,0 +1,157 @@
+"""
+Incremental parsing of large Open311 responses.
+"""
+
+import codecs
+import re
+from xml.etree.ElementTree import iterparse
+
+try:
+    from xml.etree.ElementTree import XMLPullParser
+except ImportError:
+    # Python 2 only has iterparse, which reads from a file.
+    XMLPullParser = None
+
+import simplejson as json
+
+
+# Same namespace handling as relaxml.
+namespace = re.compile(r"\{(.*)\}(.*)")
+
+# Whitespace and commas between items in a JSON array.
+separator = re.compile(r"[\s,]*")
+
+
+def iter_xml(chunks, tags=('request', 'service')):
+    """
+    Parse XML from an iterable of byte chunks, yielding each top-level
+    element with one of the given tags as soon as it's complete. Records
+    have the same shape `relaxml` gives them, and each element is thrown
+    away once it's yielded.
+
+    >>> for record in iter_xml(response.iter_content(8192)):
+    ...     print(record['service_request_id'])
+    """
+    if XMLPullParser is None:
+        events = iterparse(_Reader(chunks), events=('start', 'end'))
+    else:
+        events = _pull(XMLPullParser(events=('start', 'end')), chunks)
+    root = None
+    depth = 0
+    for event, element in events:
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = element
+            continue
+        depth -= 1
+        if depth == 1:
+            tag = _namespace_split(element.tag)
+            if tag in tags:
+                yield _parse_node(element)
+            root.remove(element)
+
+
+def _pull(parser, chunks):
+    """Feed chunks to a pull parser, yielding its events as they come."""
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event in parser.read_events():
+            yield event
+    parser.close()
+    for event in parser.read_events():
+        yield event
+
+
+class _Reader(object):
+    """A file-like view of an iterable of byte chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def iter_json(chunks):
+    """
+    Decode a top-level JSON array from an iterable of byte chunks,
+    yielding each item as soon as it has fully arrived. Only the item
+    currently being read is ever buffered.
+
+    >>> for record in iter_json(response.iter_content(8192)):
+    ...     print(record['service_request_id'])
+    """
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in chunks:
+        buffer += decode(chunk)
+        index = 0
+        while True:
+            index = separator.match(buffer, index).end()
+            if index == len(buffer):
+                break
+            if not started:
+                if buffer[index] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                index += 1
+                continue
+            if buffer[index] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, index)
+            except ValueError:
+                # The item hasn't fully arrived yet.
+                break
+            if end == len(buffer) and buffer[end - 1] not in '}]"':
+                # A number or literal might still have more to come.
+                break
+            yield item
+            index = end
+        buffer = buffer[index:]
+    raise ValueError("Unterminated JSON array")
+
+
+def _parse_node(node):
+    """Turn an element into a dict, the same way `relaxml` does."""
+    tree = {}
+    text = node.text
+    attrib = dict(node.attrib)
+    if text and attrib:
+        attrib[node.tag] = text
+        text = ''
+    if text and text.strip():
+        return text
+    for key, value in attrib.items():
+        tree[_namespace_split(key)] = value
+    for child in node:
+        tag = _namespace_split(child.tag)
+        value = _parse_node(child)
+        if tag not in tree:
+            tree[tag] = value
+            continue
+        old = tree[tag]
+        if not isinstance(old, list):
+            tree[tag] = [old]
+        tree[tag].append(value)
+    return tree
+
+
+def _namespace_split(tag):
+    """Strip any namespace from a tag."""
+    result = namespace.search(tag)
+    if result:
+        tag = result.group(2)
+    return tag
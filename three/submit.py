@@ -0,0 +1,235 @@
+"""
+Streaming uploads and bulk submission of new service requests.
+
+>>> from three import Three, submit
+>>> reports = [{'service_code': '001', 'address': '85 2nd St',
+...             'description': 'Pothole', 'media': 'pothole.jpg'}]
+>>> for result in submit(Three('api.city.gov', api_key='KEY'), reports):
+...     print(result['key'], result['status'])
+"""
+
+import hashlib
+import mimetypes
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import simplejson as json
+
+
+class MultipartStream(object):
+    """
+    A `multipart/form-data` body that reads its files from disk a chunk at
+    a time as it's sent, rather than loading them into memory. It knows
+    its length up front, so the upload gets a normal `Content-Length`
+    header, and it can be iterated again if the request is retried.
+    """
+
+    def __init__(self, fields, files, chunk_size=64 * 1024):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % (
+            self.boundary)
+        self.chunk_size = chunk_size
+        self.parts = []
+        for name, value in sorted(fields.items()):
+            if value is None:
+                continue
+            header = self._header(name)
+            self.parts.append(header + _bytes(value) + b'\r\n')
+        for name, media in files.items():
+            filename = os.path.basename(_filename(media))
+            kind = mimetypes.guess_type(filename)[0]
+            header = self._header(name, filename,
+                                  kind or 'application/octet-stream')
+            self.parts.extend([header, _Media(media), b'\r\n'])
+        self.parts.append(('--%s--\r\n' % self.boundary).encode('ascii'))
+
+    def _header(self, name, filename=None, kind=None):
+        """The boundary and headers that start a part."""
+        header = '--%s\r\nContent-Disposition: form-data; name="%s"' % (
+            self.boundary, name)
+        if filename is not None:
+            header += '; filename="%s"\r\nContent-Type: %s' % (filename, kind)
+        return (header + '\r\n\r\n').encode('utf-8')
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, _Media):
+                for chunk in part.chunks(self.chunk_size):
+                    yield chunk
+            else:
+                yield part
+
+
+class _Media(object):
+    """A file to upload, given as a path or an open binary file."""
+
+    def __init__(self, media):
+        self.media = media
+        if hasattr(media, 'read'):
+            self.start = media.tell()
+            media.seek(0, os.SEEK_END)
+            self.size = media.tell() - self.start
+            media.seek(self.start)
+        else:
+            self.size = os.path.getsize(media)
+
+    def __len__(self):
+        return self.size
+
+    def chunks(self, chunk_size):
+        if hasattr(self.media, 'read'):
+            self.media.seek(self.start)
+            f, close = self.media, False
+        else:
+            f, close = open(self.media, 'rb'), True
+        try:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if close:
+                f.close()
+
+
+class Ledger(object):
+    """
+    A record of which reports have already been submitted, keyed by their
+    idempotency keys, and optionally saved to a JSON file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.results = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.results = json.load(f)
+
+    def get(self, key):
+        with self._lock:
+            return self.results.get(key)
+
+    def record(self, key, result):
+        with self._lock:
+            self.results[key] = result
+            if self.path:
+                temporary = self.path + '.tmp'
+                with open(temporary, 'w') as f:
+                    json.dump(self.results, f)
+                os.rename(temporary, self.path)
+
+
+def idempotency_key(report):
+    """
+    Build a stable key for a report from its contents, unless it already
+    has an `idempotency_key` of its own.
+    """
+    if report.get('idempotency_key'):
+        return report['idempotency_key']
+    fields = {}
+    for name, value in report.items():
+        if name == 'media':
+            value = _filename(value)
+        fields[name] = value
+    content = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def submit(client, reports, workers=4, ledger=None):
+    """
+    POST many reports with at most `workers` in flight at once, streaming
+    any `media` from disk. Yields a result dict for every report, in
+    order, with its idempotency `key`, HTTP `status`, converted `data` and
+    any `error`. Reports whose key is already in the `ledger` (a `Ledger`
+    or the path to one) aren't sent again; their earlier result comes back
+    with `duplicate` set.
+    """
+    if not isinstance(ledger, Ledger):
+        ledger = Ledger(ledger)
+    window = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for report in reports:
+            key = idempotency_key(report)
+            earlier = [future for k, future, _ in window if k == key]
+            if earlier:
+                # The same report twice in a row is only sent once.
+                window.append((key, earlier[0], True))
+            else:
+                future = executor.submit(_submit_one, client, report, key,
+                                         ledger)
+                window.append((key, future, False))
+            while len(window) > workers * 2:
+                yield _result(*window.popleft())
+        while window:
+            yield _result(*window.popleft())
+
+
+def _result(key, future, repeated):
+    """Wait for a submission's result."""
+    result = dict(future.result())
+    if repeated:
+        result['duplicate'] = True
+    return result
+
+
+def _submit_one(client, report, key, ledger):
+    """Submit a single report, unless the ledger has already seen it."""
+    previous = ledger.get(key)
+    if previous is not None:
+        return dict(previous, duplicate=True)
+    report = dict(report)
+    report.pop('idempotency_key', None)
+    code = report.pop('service_code', '0')
+    result = {'key': key, 'status': None, 'data': None, 'error': None,
+              'duplicate': False}
+    try:
+        result['data'] = client.post(code, **report)
+        result['status'] = client.post_response.status_code
+    except Exception as error:
+        result['error'] = str(error)
+        return result
+    if result['status'] < 400:
+        ledger.record(key, result)
+    return result
+
+
+def streamable(media):
+    """
+    Whether media can be streamed from disk: a path, or a binary file that
+    can seek back to the start if the upload is retried.
+    """
+    if isinstance(media, str):
+        return True
+    if not hasattr(media, 'read'):
+        return False
+    try:
+        if hasattr(media, 'seekable') and not media.seekable():
+            return False
+        media.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+    return True
+
+
+def _filename(media):
+    """Find the file name for a path or open file."""
+    if hasattr(media, 'read'):
+        return getattr(media, 'name', 'media')
+    return media
+
+
+def _bytes(value):
+    """Encode a form value."""
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, str):
+        value = str(value)
+    return value.encode('utf-8')
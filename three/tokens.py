@@ -0,0 +1,113 @@
+"""
+Resolve the tokens handed back by POST requests into service request IDs.
+
+>>> from three import Three, TokenResolver
+>>> resolver = TokenResolver(Three('api.city.gov'), path='pending.json')
+>>> resolver.add(['abc123', 'def456'])
+>>> for token, id in resolver.resolve():
+...     print(token, id)
+"""
+
+import heapq
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import simplejson as json
+
+
+class TokenResolver(object):
+    """
+    Poll many outstanding tokens at once, each with its own exponential
+    backoff, until the city assigns them a `service_request_id`. When a
+    `path` is given, pending tokens are saved there so they survive a
+    restart.
+    """
+
+    def __init__(self, client, path=None, workers=8, delay=1, factor=2,
+                 maximum=300):
+        self.client = client
+        self.path = path
+        self.workers = workers
+        self.delay = delay
+        self.factor = factor
+        self.maximum = maximum
+        self.pending = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.pending.update(json.load(f))
+
+    def add(self, tokens):
+        """Start tracking more tokens."""
+        if isinstance(tokens, str):
+            tokens = [tokens]
+        self.pending.update(tokens)
+        self._save()
+
+    def resolve(self, timeout=None):
+        """
+        Poll the pending tokens, yielding `(token, service_request_id)`
+        pairs as each one resolves. Stops once every token has resolved,
+        or after `timeout` seconds, leaving the rest pending.
+        """
+        deadline = time.time() + timeout if timeout else None
+        now = time.time()
+        queue = [(now, token, 0) for token in sorted(self.pending)]
+        heapq.heapify(queue)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while queue or running:
+                now = time.time()
+                if deadline and now >= deadline:
+                    break
+                while queue and queue[0][0] <= now and \
+                        len(running) < self.workers:
+                    due, token, attempts = heapq.heappop(queue)
+                    future = executor.submit(self._check, token)
+                    running[future] = (token, attempts)
+                waits = [deadline - now] if deadline else []
+                if queue and len(running) < self.workers:
+                    waits.append(queue[0][0] - now)
+                if not running:
+                    time.sleep(max(0, min(waits)))
+                    continue
+                done, _ = wait(list(running), timeout=min(waits or [None]),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    token, attempts = running.pop(future)
+                    try:
+                        id = future.result()
+                    except Exception:
+                        id = None
+                    if id is None:
+                        due = time.time() + self._backoff(attempts)
+                        heapq.heappush(queue, (due, token, attempts + 1))
+                        continue
+                    self.pending.discard(token)
+                    self._save()
+                    yield token, id
+            for future in running:
+                future.cancel()
+
+    def _check(self, token):
+        """Ask the city whether a token has a service request ID yet."""
+        data = self.client.token(token)
+        for record in self.client._records(data):
+            id = record.get('service_request_id')
+            if id and id != {}:
+                return id
+
+    def _backoff(self, attempts):
+        """How long to wait before checking a token again."""
+        delay = min(self.maximum, self.delay * self.factor ** attempts)
+        return random.uniform(delay / 2.0, delay)
+
+    def _save(self):
+        """Write the pending tokens to disk, if there's a path."""
+        if not self.path:
+            return
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(sorted(self.pending), f)
+        os.rename(temporary, self.path)